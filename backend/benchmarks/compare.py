@@ -0,0 +1,44 @@
+'''
+Compares two benchmarks/run.py result files.
+
+    python benchmarks/compare.py before.json after.json
+
+Prints the p50, p95, p99 latency and throughput of every scenario with
+the relative change, negative latency changes are improvements.
+'''
+import json
+import sys
+
+METRICS = ('p50_ms', 'p95_ms', 'p99_ms', 'throughput_rps')
+
+
+def change(before, after):
+    if not before:
+        return ''
+    return '{:+.1f}%'.format((after - before) / before * 100)
+
+
+def main():
+    if len(sys.argv) != 3:
+        sys.exit(__doc__)
+
+    with open(sys.argv[1]) as before_file, open(sys.argv[2]) as after_file:
+        before, after = json.load(before_file), json.load(after_file)
+
+    print('{} ({} questions) -> {} ({} questions)'.format(
+        before['commit'], before['dataset']['questions'],
+        after['commit'], after['dataset']['questions']))
+    print('{:<24}{:<16}{:>12}{:>12}{:>10}'.format(
+        'scenario', 'metric', 'before', 'after', 'change'))
+
+    for name, result in after['results'].items():
+        if name not in before['results']:
+            continue
+        for metric in METRICS:
+            old, new = before['results'][name][metric], result[metric]
+            print('{:<24}{:<16}{:>12}{:>12}{:>10}'.format(
+                name, metric, old, new, change(old, new)))
+
+
+if __name__ == '__main__':
+    main()
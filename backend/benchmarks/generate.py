@@ -0,0 +1,98 @@
+'''
+Fills a database with synthetic questions for the benchmarks.
+
+    python benchmarks/generate.py --size 100k --categories 6 --reset
+
+--size is 10k, 100k, 1m or a number of questions. The database is the
+DATABASE_URL of the app (a local Postgres, or sqlite:///bench.db as a
+stand-in). The same --seed always generates the same data. --reset
+deletes every question and category first.
+'''
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from flaskr import create_app, bulk  # noqa: E402
+from models import db, migrate_db, Question, Category  # noqa: E402
+
+SIZES = {
+    '10k': 10000,
+    '100k': 100000,
+    '1m': 1000000
+}
+VOCABULARY_SIZE = 2000
+SYLLABLES = ['ka', 'lo', 'mi', 'ra', 'te', 'su', 'no', 'vi', 'ben', 'dor',
+             'gal', 'pex', 'tum', 'zar', 'qui', 'fen']
+
+
+def vocabulary(rng):
+    '''Returns VOCABULARY_SIZE distinct pseudo words'''
+    words = set()
+    while len(words) < VOCABULARY_SIZE:
+        words.add(''.join(rng.choice(SYLLABLES)
+                          for _ in range(rng.randint(2, 4))))
+    return sorted(words)
+
+
+def question_rows(count, category_ids, rng):
+    '''Yields parse_rows() style rows for bulk.import_questions()'''
+    words = vocabulary(rng)
+
+    for line_number in range(1, count + 1):
+        text = ' '.join(rng.choice(words) for _ in range(rng.randint(6, 14)))
+        yield line_number, {
+            'question': text.capitalize() + '?',
+            'answer': ' '.join(rng.choice(words)
+                               for _ in range(rng.randint(1, 3))),
+            'category': rng.choice(category_ids),
+            'difficulty': rng.randint(1, 5)
+        }, None
+
+
+def parse_size(size):
+    return SIZES.get(size.lower()) or int(size)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--size', default='10k',
+                        help='10k, 100k, 1m or a number of questions')
+    parser.add_argument('--categories', type=int, default=6)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--reset', action='store_true',
+                        help='delete all questions and categories first')
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    app = create_app()
+
+    with app.app_context():
+        migrate_db()
+
+        if args.reset:
+            Question.query.delete()
+            Category.query.delete()
+            db.session.commit()
+
+        categories = [Category(type='Category {}'.format(number))
+                      for number in range(1, args.categories + 1)]
+        db.session.add_all(categories)
+        db.session.commit()
+        category_ids = [category.id for category in categories]
+
+        started = time.perf_counter()
+        report = bulk.import_questions(
+            question_rows(parse_size(args.size), category_ids, rng),
+            set(category_ids))
+
+        print('inserted {} questions in {} categories in {:.1f}s'.format(
+            report['imported'], len(category_ids),
+            time.perf_counter() - started))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,268 @@
+'''
+Measures the latency and throughput of every endpoint.
+
+    python benchmarks/run.py [--requests 200] [--concurrency 1]
+        [--url http://localhost:5000] [--no-response-cache]
+        [--output results.json]
+
+Without --url the requests go to an in-process app using DATABASE_URL,
+fill it first with benchmarks/generate.py. Every scenario reports p50,
+p95 and p99 latency and throughput. The JSON results carry the git
+commit and dataset size, compare two runs with benchmarks/compare.py.
+
+A server given with --url has to run with ADMISSION_CONTROL=off, else
+its rate and concurrency limits answer part of the requests: those
+are counted as rejected and reported.
+'''
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from flaskr import create_app, QUESTIONS_PER_PAGE  # noqa: E402
+
+# questions answered in one quiz, previous_questions grows every step
+QUIZ_STEPS = 20
+# statuses of the rate and concurrency limits of the server
+REJECTED = (429, 503)
+
+
+class InProcessClient:
+    '''Sends requests to the Flask app through its test client'''
+
+    def __init__(self, app):
+        self.app = app
+        self.local = threading.local()
+
+    def send(self, method, path, body=None):
+        if not hasattr(self.local, 'client'):
+            self.local.client = self.app.test_client()
+        response = self.local.client.open(path, method=method, json=body)
+        return response.status_code, response.get_data()
+
+
+class HTTPClient:
+    '''Sends requests to a running server'''
+
+    def __init__(self, url):
+        self.url = url.rstrip('/')
+
+    def send(self, method, path, body=None):
+        data = None if body is None else json.dumps(body).encode()
+        request = urllib.request.Request(
+            self.url + path, data=data, method=method,
+            headers={'Content-Type': 'application/json'})
+        try:
+            with urllib.request.urlopen(request) as response:
+                return response.status, response.read()
+        except urllib.error.HTTPError as error:
+            return error.code, error.read()
+
+
+def dataset(client):
+    '''Returns the sizes the scenarios need to build their requests'''
+    _, body = client.send('GET', '/questions?page=1')
+    first_page = json.loads(body)
+    total = first_page['total_questions']
+    last_page = max((total + QUESTIONS_PER_PAGE - 1) // QUESTIONS_PER_PAGE, 1)
+
+    _, body = client.send('GET', '/questions?page={}'.format(last_page))
+    last_id = json.loads(body)['questions'][-1]['id']
+
+    words = [word.strip('?,.').lower()
+             for question in first_page['questions']
+             for word in question['question'].split() if len(word) > 3]
+
+    return {
+        'questions': total,
+        'categories': sorted(int(category_id)
+                             for category_id in first_page['categories']),
+        'last_page': last_page,
+        'last_id': last_id,
+        'words': words or ['a']
+    }
+
+
+def scenarios(data):
+    '''Returns {name: function(send, rng)} sending one or more requests'''
+
+    def categories(send, rng):
+        send('GET', '/categories')
+
+    def questions_first_page(send, rng):
+        send('GET', '/questions?page=1')
+
+    def questions_deep_page(send, rng):
+        send('GET', '/questions?page={}'.format(data['last_page']))
+
+    def questions_deep_cursor(send, rng):
+        send('GET', '/questions?after={}&limit={}'.format(
+            max(data['last_id'] - QUESTIONS_PER_PAGE - 1, 0),
+            QUESTIONS_PER_PAGE))
+
+    def category_questions(send, rng):
+        send('GET', '/categories/{}/questions'.format(
+            rng.choice(data['categories'])))
+
+    def search(send, rng):
+        send('POST', '/questions', {'searchTerm': rng.choice(data['words'])})
+
+    def quiz(send, rng):
+        previous_questions = []
+        quiz_category = {'id': rng.choice([0] + data['categories'])}
+
+        for _ in range(QUIZ_STEPS):
+            status, body = send('POST', '/quizzes', {
+                'previous_questions': previous_questions,
+                'quiz_category': quiz_category
+            })
+            question = json.loads(body).get('question') \
+                if status == 200 else None
+            if not question:
+                break
+            previous_questions.append(question['id'])
+
+    return {
+        'categories': categories,
+        'questions_first_page': questions_first_page,
+        'questions_deep_page': questions_deep_page,
+        'questions_deep_cursor': questions_deep_cursor,
+        'category_questions': category_questions,
+        'search': search,
+        'quiz': quiz
+    }
+
+
+def percentile(timings, percent):
+    '''Nearest rank percentile of sorted timings'''
+    rank = max(int(round(percent / 100 * len(timings) + 0.5)) - 1, 0)
+    return timings[min(rank, len(timings) - 1)]
+
+
+def measure(client, scenario, runs, concurrency, seed):
+    '''Runs a scenario, returns its latency and throughput'''
+    timings = []
+    errors = []
+    lock = threading.Lock()
+
+    def send(method, path, body=None):
+        started = time.perf_counter()
+        status, response = client.send(method, path, body)
+        elapsed = time.perf_counter() - started
+        with lock:
+            timings.append(elapsed)
+            if status >= 400:
+                errors.append(status)
+        return status, response
+
+    # loads indexes and caches before measuring
+    scenario(lambda *args: client.send(*args), random.Random(seed))
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        results = [executor.submit(scenario, send, random.Random(seed + run))
+                   for run in range(runs)]
+        for result in results:
+            result.result()
+    elapsed = time.perf_counter() - started
+
+    timings.sort()
+    return {
+        'requests': len(timings),
+        'errors': len(errors),
+        # answered by the admission control of the server
+        'rejected': sum(status in REJECTED for status in errors),
+        'mean_ms': round(sum(timings) / len(timings) * 1000, 3),
+        'p50_ms': round(percentile(timings, 50) * 1000, 3),
+        'p95_ms': round(percentile(timings, 95) * 1000, 3),
+        'p99_ms': round(percentile(timings, 99) * 1000, 3),
+        'throughput_rps': round(len(timings) / elapsed, 1)
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--requests', type=int, default=200,
+                        help='runs per scenario, a quiz run is {} steps'
+                        .format(QUIZ_STEPS))
+    parser.add_argument('--concurrency', type=int, default=1)
+    parser.add_argument('--url', default=None,
+                        help='server to benchmark instead of an '
+                        'in-process app')
+    parser.add_argument('--no-response-cache', action='store_true',
+                        help='disable the response cache of the '
+                        'in-process app')
+    parser.add_argument('--scenario', action='append', default=None,
+                        help='only run this scenario, can be repeated')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--output', default=None,
+                        help='also write the JSON results to this file')
+    args = parser.parse_args()
+
+    if args.url:
+        client = HTTPClient(args.url)
+        target = args.url
+    else:
+        config = {'ADMISSION_CONTROL': False}
+        if args.no_response_cache:
+            config['RESPONSE_CACHE_MAX_ENTRIES'] = 0
+        app = create_app(config)
+        client = InProcessClient(app)
+        target = app.config['DATABASE_URL'].rsplit('@', 1)[-1]
+
+    data = dataset(client)
+    results = {}
+
+    for name, scenario in scenarios(data).items():
+        if args.scenario and name not in args.scenario:
+            continue
+        runs = max(args.requests // QUIZ_STEPS, 1) if name == 'quiz' \
+            else args.requests
+        results[name] = measure(
+            client, scenario, runs, args.concurrency, args.seed)
+        print('{:<24}{}'.format(name, json.dumps(results[name])),
+              file=sys.stderr)
+        if results[name]['rejected']:
+            print('warning: {} requests of {} were rate or concurrency '
+                  'limited, run the server with ADMISSION_CONTROL=off'
+                  .format(results[name]['rejected'], name), file=sys.stderr)
+
+    report = json.dumps({
+        'commit': git_commit(),
+        'target': target,
+        'response_cache': not args.no_response_cache,
+        'concurrency': args.concurrency,
+        'dataset': {
+            'questions': data['questions'],
+            'categories': len(data['categories'])
+        },
+        'results': results
+    }, indent=2)
+
+    print(report)
+    if args.output:
+        with open(args.output, 'w') as output:
+            output.write(report + '\n')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,60 @@
+'''
+Measures how long create_app() takes, the boot time of every worker
+and of every TriviaTestCase.setUp.
+
+    python benchmarks/startup.py [--runs 20] [--create-all]
+
+--create-all also runs db.create_all() after create_app(), which is
+what every boot did before the schema moved to "flask migrate".
+Prints a JSON line that can be compared between commits.
+'''
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from flaskr import create_app  # noqa: E402
+from models import db  # noqa: E402
+
+
+def measure(runs, create_all):
+    timings = []
+
+    for _ in range(runs):
+        started = time.perf_counter()
+        app = create_app()
+        if create_all:
+            with app.app_context():
+                db.create_all()
+        timings.append(time.perf_counter() - started)
+
+        with app.app_context():
+            db.get_engine(app).dispose()
+
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--runs', type=int, default=20)
+    parser.add_argument('--create-all', action='store_true')
+    args = parser.parse_args()
+
+    timings = measure(args.runs, args.create_all)
+
+    print(json.dumps({
+        'benchmark': 'startup',
+        'create_all': args.create_all,
+        'runs': args.runs,
+        'mean_ms': round(statistics.mean(timings) * 1000, 3),
+        'median_ms': round(statistics.median(timings) * 1000, 3),
+        'max_ms': round(max(timings) * 1000, 3)
+    }))
+
+
+if __name__ == '__main__':
+    main()
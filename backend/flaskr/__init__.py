@@ -1,19 +1,261 @@
 import os
-from flask import Flask, request, abort, jsonify
+import io
+import functools
+import math
+import time
+import click
+from flask import Flask, request, abort, jsonify, current_app, \
+    has_app_context, Response, stream_with_context, g
 from flask_sqlalchemy import SQLAlchemy
 from sqlalchemy.exc import OperationalError
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
 from flask_cors import CORS
-import random
+from werkzeug.datastructures import MultiDict
 
-from models import setup_db, Question, Category
+from models import setup_db, migrate_db, db, Question, Category, \
+    question_listeners, category_listeners, database_path, pool_metrics, \
+    get_setting, use_replica, wrote_to_primary
+from .category_cache import CategoryCache
+from .compression import Compressor, COMPRESS_MIN_SIZE, etag_variants
+from .decks import Decks, generate_decks, DECKS_PER_CATEGORY
+from .difficulty import draw
+from .instrumentation import RequestTimings, RouteMetrics, \
+    timed_json_encoder, add_serialize_time
+from .response_cache import ResponseCache
+from .quiz_index import QuizIndex, ALL_CATEGORIES
+from .quiz_sessions import QuizSession
+from .rate_limit import RateLimiter, ConcurrencyGate
+from .search_index import SearchIndex, tokenize
+from .shared_quiz_index import SharedQuizIndex
+from .serialization import QUESTION_COLUMNS, QuestionFragments, \
+    default_dumps, encode
+from .stores import MemoryStore, SqliteStore
+from .validation import validate_question, validate_search
+from . import bulk
 
 QUESTIONS_PER_PAGE = 10
+# upper bound of ?limit= in cursor pagination
+MAX_QUESTIONS_PER_PAGE = 100
+# upper bound of "count" of a quiz batch
+MAX_QUIZ_QUESTIONS = 50
+# seconds after which a worker reloads its indexes from the database
+QUIZ_INDEX_MAX_AGE = 300
+SEARCH_INDEX_MAX_AGE = 300
+# seconds after which a worker reloads the categories it has cached
+CATEGORY_CACHE_MAX_AGE = 60
+# seconds a cached response is kept, bounds staleness between workers
+RESPONSE_CACHE_TTL = 30
+RESPONSE_CACHE_MAX_ENTRIES = 10000
+INDEX_LOAD_BATCH = 10000
+# seconds an encoded question is reused, bounds staleness between workers
+QUESTION_FRAGMENT_TTL = 30
+QUESTION_FRAGMENT_MAX_ENTRIES = 100000
+# suggestions returned by /questions/autocomplete
+AUTOCOMPLETE_LIMIT = 10
+MAX_AUTOCOMPLETE_LIMIT = 50
+# seconds a quiz session is kept after its last use
+QUIZ_SESSION_TTL = 3600
+# POST endpoints that only read, served by the read replicas like GETs
+REPLICA_READ_ENDPOINTS = {
+    'get_quiz', 'create_quiz_session', 'get_quiz_session_question'}
+# set after a write, the client reads from the primary while it is set
+READ_PRIMARY_COOKIE = 'trivia_read_primary'
+# statements running longer are logged with their parameters
+SLOW_QUERY_MS = 200
+# requests per second and burst of a client on the expensive routes,
+# 'search' is POST /questions with a searchTerm, only applied once the
+# client is known, see RATE_LIMIT_CLIENT_KEY
+RATE_LIMITS = {
+    'get_quiz': (10, 30),
+    'get_quiz_session_question': (10, 30),
+    'search': (10, 30)
+}
+# requests of a route running at once in a worker, kept below the
+# database pool size so one route cannot take all connections
+CONCURRENCY_LIMITS = {
+    'get_quiz': 10,
+    'get_quiz_session_question': 10,
+    'search': 10
+}
+# requests of a client running at once on those routes in a worker
+CLIENT_CONCURRENCY_LIMIT = 4
+# client key of the remote address, any other key names a header
+REMOTE_ADDR = 'remote_addr'
+
+
+def category_tag(category_id):
+    '''Returns the response cache tag of a category'''
+    return 'category:{}'.format(category_id)
+
+
+def on_question_change(action, questions, previous=None):
+    '''
+    Keeps the indexes and caches of the current app in sync, every tag
+    of the changed questions is outdated once whatever their number
+    '''
+    if not has_app_context():
+        return
+
+    quiz_index = current_app.extensions['quiz_index']
+    search_index = current_app.extensions['search_index']
+    question_fragments = current_app.extensions['question_fragments']
+
+    # only the question lists of the old and new categories are outdated
+    categories = {question['category'] for question in questions}
+    for question in questions:
+        categories.add(quiz_index.category_of(question['id']))
+    # the quiz index may not be loaded, the updater knows the old rows
+    categories.update(question['category'] for question in previous or ())
+    categories.discard(None)
+    current_app.extensions['response_cache'].invalidate(
+        'questions', *[category_tag(category) for category in categories])
+
+    for question in questions:
+        question_fragments.invalidate(question['id'])
+        if action == 'delete':
+            quiz_index.remove(question['id'])
+            search_index.remove(question['id'])
+        else:
+            quiz_index.add(question['id'], question['category'],
+                           question['difficulty'])
+            search_index.add(
+                question['id'], question['question'], question['answer'])
+
+
+question_listeners.append(on_question_change)
+
+
+def on_questions_bulk_change(categories):
+    '''Outdates the indexes and caches of the current app after a bulk
+    change of questions in categories'''
+    current_app.extensions['quiz_index'].invalidate()
+    current_app.extensions['search_index'].invalidate()
+    current_app.extensions['response_cache'].invalidate(
+        'questions', *[category_tag(category) for category in categories])
+
+
+def on_category_change(action, category):
+    '''Drops the cached categories of the current app after a change'''
+    if not has_app_context():
+        return
+
+    current_app.extensions['category_cache'].invalidate()
+    current_app.extensions['response_cache'].invalidate('categories')
+
+
+category_listeners.append(on_category_change)
 
 
 def create_app(test_config=None):
     # create and configure the app
     app = Flask(__name__)
-    setup_db(app)
+    app.config.from_mapping(
+        # DB_POOL_* settings can be set here too, see models.POOL_SETTINGS,
+        # as well as the read replicas, see models.REPLICA_SETTINGS
+        DATABASE_URL=database_path,
+        QUIZ_SESSION_TTL=QUIZ_SESSION_TTL,
+        # any object with get/set/delete, see flaskr.stores.MemoryStore
+        QUIZ_SESSION_STORE=None,
+        # the *_PATH settings are also read from the environment
+        # path of a SQLite file holding the quiz sessions of all the
+        # workers of a host, per worker in memory if None
+        QUIZ_SESSION_PATH=os.environ.get('QUIZ_SESSION_PATH'),
+        # path of a SQLite file to share cached responses between the
+        # workers of a host, cached per worker in memory if None
+        RESPONSE_CACHE_PATH=os.environ.get('RESPONSE_CACHE_PATH'),
+        RESPONSE_CACHE_TTL=RESPONSE_CACHE_TTL,
+        RESPONSE_CACHE_MAX_ENTRIES=RESPONSE_CACHE_MAX_ENTRIES,
+        # path of a file holding the quiz index once for all the workers
+        # of a host (memory mapped), every worker loads its own if None
+        QUIZ_INDEX_PATH=os.environ.get('QUIZ_INDEX_PATH'),
+        # file of the quiz decks written by "flask generate-decks", quizzes
+        # are drawn from the quiz index if None
+        QUIZ_DECKS_PATH=os.environ.get('QUIZ_DECKS_PATH'),
+        # bytes from which JSON bodies are compressed, None to disable
+        COMPRESS_MIN_SIZE=COMPRESS_MIN_SIZE,
+        # None disables the slow query log
+        SLOW_QUERY_MS=SLOW_QUERY_MS,
+        SERVER_TIMING=True,
+        # callable encoding a JSON value to bytes with sorted keys,
+        # orjson if installed, see flaskr.serialization
+        JSON_DUMPS=None,
+        # {route: (rate, burst)}, see flaskr.rate_limit.RateLimiter
+        RATE_LIMITS=RATE_LIMITS,
+        # {client address: {route: (rate, burst) or None for no limit}}
+        CLIENT_RATE_LIMITS={},
+        # path of a SQLite file to share the rate limits between the
+        # workers of a host, per worker in memory if None
+        RATE_LIMIT_PATH=os.environ.get('RATE_LIMIT_PATH'),
+        # what tells clients apart: 'remote_addr', or the name of a header
+        # set by a trusted proxy. None (the default) applies no per
+        # client limits, only the per worker CONCURRENCY_LIMITS
+        RATE_LIMIT_CLIENT_KEY=os.environ.get('RATE_LIMIT_CLIENT_KEY'),
+        CONCURRENCY_LIMITS=CONCURRENCY_LIMITS,
+        CLIENT_CONCURRENCY_LIMIT=CLIENT_CONCURRENCY_LIMIT,
+        # False (or ADMISSION_CONTROL=off in the environment) turns the
+        # rate and concurrency limits off, e.g. for benchmarks
+        ADMISSION_CONTROL=os.environ.get('ADMISSION_CONTROL') != 'off'
+    )
+    if test_config is not None:
+        app.config.from_mapping(test_config)
+
+    setup_db(app, app.config['DATABASE_URL'])
+
+    '''Yields the quiz index rows of a background rebuild'''
+    def quiz_index_rows():
+        with app.app_context():
+            yield from db.session.query(
+                Question.id, Question.category, Question.difficulty).\
+                yield_per(INDEX_LOAD_BATCH)
+
+    if app.config['QUIZ_INDEX_PATH']:
+        app.extensions['quiz_index'] = SharedQuizIndex(
+            app.config['QUIZ_INDEX_PATH'], quiz_index_rows,
+            max_age=QUIZ_INDEX_MAX_AGE)
+    else:
+        app.extensions['quiz_index'] = QuizIndex(max_age=QUIZ_INDEX_MAX_AGE)
+    app.extensions['decks'] = Decks(app.config['QUIZ_DECKS_PATH']) \
+        if app.config['QUIZ_DECKS_PATH'] else None
+    app.extensions['search_index'] = SearchIndex(max_age=SEARCH_INDEX_MAX_AGE)
+    app.extensions['category_cache'] = CategoryCache(
+        max_age=CATEGORY_CACHE_MAX_AGE)
+
+    if app.config['RESPONSE_CACHE_PATH']:
+        shared_store = SqliteStore(app.config['RESPONSE_CACHE_PATH'])
+        response_cache = ResponseCache(
+            shared_store, shared_store, ttl=app.config['RESPONSE_CACHE_TTL'])
+    else:
+        response_cache = ResponseCache(MemoryStore(
+            ttl=app.config['RESPONSE_CACHE_TTL'],
+            max_entries=app.config['RESPONSE_CACHE_MAX_ENTRIES']))
+    app.extensions['response_cache'] = response_cache
+    if app.config['QUIZ_SESSION_STORE'] is not None:
+        quiz_sessions = app.config['QUIZ_SESSION_STORE']
+    elif app.config['QUIZ_SESSION_PATH']:
+        quiz_sessions = SqliteStore(
+            app.config['QUIZ_SESSION_PATH'],
+            ttl=app.config['QUIZ_SESSION_TTL'])
+    else:
+        quiz_sessions = MemoryStore(ttl=app.config['QUIZ_SESSION_TTL'])
+    app.extensions['quiz_sessions'] = quiz_sessions
+    app.extensions['route_metrics'] = RouteMetrics()
+    app.extensions['rate_limiter'] = RateLimiter(
+        SqliteStore(app.config['RATE_LIMIT_PATH'])
+        if app.config['RATE_LIMIT_PATH'] else MemoryStore(),
+        app.config['RATE_LIMITS'], app.config['CLIENT_RATE_LIMITS'])
+    app.extensions['concurrency_gate'] = ConcurrencyGate(
+        app.config['CONCURRENCY_LIMITS'],
+        app.config['CLIENT_CONCURRENCY_LIMIT'])
+    app.extensions['compressor'] = Compressor(
+        MemoryStore(ttl=app.config['RESPONSE_CACHE_TTL'],
+                    max_entries=app.config['RESPONSE_CACHE_MAX_ENTRIES']),
+        app.config['COMPRESS_MIN_SIZE'])
+    dumps = app.config['JSON_DUMPS'] or default_dumps()
+    app.extensions['question_fragments'] = QuestionFragments(
+        MemoryStore(ttl=QUESTION_FRAGMENT_TTL,
+                    max_entries=QUESTION_FRAGMENT_MAX_ENTRIES),
+        dumps)
+    app.json_encoder = timed_json_encoder(app.json_encoder)
 
     '''
     DONE: Set up CORS. Allow '*' for origins.
@@ -31,18 +273,278 @@ def create_app(test_config=None):
                              'GET,PATCH,POST,DELETE,OPTIONS')
         return response
 
+    '''Compresses the JSON responses for the clients accepting it'''
+    @app.after_request
+    def compress_response(response):
+        if app.config['COMPRESS_MIN_SIZE'] is None:
+            return response
+
+        return app.extensions['compressor'].compress(
+            response, request.accept_encodings)
+
+    '''Returns True for POST /questions with a searchTerm'''
+    def is_search():
+        if request.endpoint != 'create_or_search_question':
+            return False
+        body = request.get_json(silent=True)
+        return isinstance(body, dict) and bool(body.get('searchTerm'))
+
+    '''
+    Reads go to the read replicas, unless the client wrote in the last
+    DB_READ_YOUR_WRITES seconds, then it reads its writes from the
+    primary. Only a request that wrote to the database sets the cookie.
+    '''
+    def is_read():
+        return request.method in ('GET', 'HEAD') or \
+            request.endpoint in REPLICA_READ_ENDPOINTS or is_search()
+
+    @app.before_request
+    def route_reads_to_replica():
+        if app.extensions['replicas'] is not None and is_read() and \
+                READ_PRIMARY_COOKIE not in request.cookies:
+            use_replica()
+
+    @app.after_request
+    def read_your_writes(response):
+        if app.extensions['replicas'] is not None and wrote_to_primary() \
+                and response.status_code < 400:
+            response.set_cookie(
+                READ_PRIMARY_COOKIE, '1', httponly=True,
+                max_age=get_setting(app.config, 'DB_READ_YOUR_WRITES'))
+        return response
+
+    '''
+    Counts the queries of every request and times them, the JSON
+    serialization and the whole request, see flaskr.instrumentation.
+    '''
+    @app.before_request
+    def start_request_timings():
+        g.request_timings = RequestTimings()
+
+    @app.after_request
+    def record_request_timings(response):
+        timings = g.get('request_timings')
+        if timings is None:
+            return response
+
+        total_time = time.perf_counter() - timings.started
+        if request.url_rule is not None:
+            app.extensions['route_metrics'].record(
+                '{} {}'.format(request.method, request.url_rule.rule),
+                timings, total_time)
+        if app.config['SERVER_TIMING']:
+            response.headers['Server-Timing'] = \
+                timings.server_timing(total_time)
+
+        return response
+
+    '''
+    Returns the rate limited route of the request, the search path of
+    POST /questions has its own
+    '''
+    def limited_route():
+        if request.endpoint == 'create_or_search_question':
+            return 'search' if is_search() else None
+        return request.endpoint
+
+    '''
+    Returns the client of the request for the per client limits, None
+    if unknown: no client key is configured, or the proxy did not set
+    the header
+    '''
+    def client_key():
+        key = app.config['RATE_LIMIT_CLIENT_KEY']
+        if key is None:
+            return None
+        if key == REMOTE_ADDR:
+            return request.remote_addr
+        return request.headers.get(key) or None
+
+    '''
+    Admission control of the expensive routes: a client past its rate
+    gets a 429, a worker running as many requests of the route (or of
+    the client) as allowed answers 503 right away instead of queueing
+    for a database connection. Both tell when to retry. A request of
+    an unknown client only counts against the per route limits.
+    '''
+    @app.before_request
+    def admit_request():
+        if not app.config['ADMISSION_CONTROL']:
+            return
+        route = limited_route()
+        if route not in app.config['RATE_LIMITS'] and \
+                route not in app.config['CONCURRENCY_LIMITS']:
+            return
+
+        client = client_key()
+        if client is not None:
+            wait = app.extensions['rate_limiter'].take(route, client)
+            if wait:
+                abort(429, {'message': 'too many requests, try again later',
+                            'retry_after': wait})
+
+        if not app.extensions['concurrency_gate'].enter(route, client):
+            abort(503, {'message': 'server busy, try again later',
+                        'retry_after': 1})
+        g.admitted = (route, client)
+
+    @app.teardown_request
+    def release_request(error=None):
+        admitted = g.pop('admitted', None)
+        if admitted is not None:
+            app.extensions['concurrency_gate'].leave(*admitted)
+
+    '''Returns the cached categories dict and its ETag'''
+    def get_categories_with_etag():
+        category_map, etag = app.extensions['category_cache'].get(
+            lambda: db.session.query(Category.id, Category.type))
+        if not category_map:
+            abort(404, description={'message': 'no category found'})
+
+        return category_map, etag
+
     '''Returns a list of categories dict'''
     def get_categories_json():
-        categories = Category.query.all()
-        if not categories:
-            abort(404, description={'message': 'no category found'})
+        return get_categories_with_etag()[0]
+
+    '''
+    Returns a JSON response of payload like jsonify, its values may be
+    pre-encoded serialization.Fragment instances.
+    '''
+    def json_response(payload):
+        started = time.perf_counter()
+        body = encode(payload, dumps) + b'\n'
+        add_serialize_time(time.perf_counter() - started)
+
+        return app.response_class(body, mimetype='application/json')
+
+    '''Returns the QUESTION_COLUMNS rows of question_ids'''
+    def load_questions(question_ids):
+        return db.session.query(*QUESTION_COLUMNS).\
+            filter(Question.id.in_(question_ids)).\
+            all()
+
+    '''
+    Caches the successful responses of the decorated GET view,
+    tags(**view_args) returns the tags the response depends on.
+    Responses without an ETag get the one of the cache key, a client
+    sending it back gets a 304 without the view running, even if the
+    entry is not (or no longer) cached.
+    '''
+    def cached_response(tags):
+        def decorator(view):
+            @functools.wraps(view)
+            def wrapper(**kwargs):
+                key = response_cache.key(
+                    request.path, request.args, tags(**kwargs))
+                response = not_modified(response_cache.etag(key))
+                if response is not None:
+                    return response
+
+                cached = response_cache.get(key)
+                if cached is None:
+                    response = view(**kwargs)
+                    if response.status_code == 200:
+                        if response.get_etag()[0] is None:
+                            response.set_etag(response_cache.etag(key))
+                        response_cache.set(
+                            key, response.get_data(), response.get_etag()[0])
+                    return response
+
+                body, etag = cached
+                response = not_modified(etag)
+                if response is None:
+                    response = app.response_class(
+                        body, mimetype='application/json')
+                    response.set_etag(etag)
+                return response
+
+            return wrapper
 
-        category_map = {}
+        return decorator
 
-        for category in categories:
-            category_map[category.id] = category.type
+    '''
+    Returns an empty 304 response if the client has the etag, or one
+    of its compressed representations
+    '''
+    def not_modified(etag):
+        for variant in etag_variants(etag):
+            if request.if_none_match.contains(variant):
+                response = app.response_class(status=304)
+                response.set_etag(variant)
+                return response
 
-        return category_map
+        return None
+
+    '''
+    Returns a page of the questions of query, as QUESTION_COLUMNS
+    rows, and the pagination fields of the response. query selects
+    the questions of category, 0 for all of them.
+
+    ?page=<n> uses OFFSET pagination and always counts the questions.
+    ?after=<id>&limit=<n> seeks past the question id instead (keyset
+    pagination) and only counts the questions if ?count=true is given.
+    The counts come from the quiz index instead of a COUNT(*).
+    '''
+    def paginate_questions(query, category=ALL_CATEGORIES):
+        after = request.args.get('after', None, type=int)
+        # plain tuples of the needed columns, no ORM objects
+        query = query.with_entities(*QUESTION_COLUMNS)
+
+        if after is None:
+            page = max(request.args.get('page', 1, type=int), 1)
+            questions = query.order_by(Question.id).\
+                limit(QUESTIONS_PER_PAGE).\
+                offset((page - 1) * QUESTIONS_PER_PAGE).\
+                all()
+            return questions, {
+                'total_questions': get_quiz_index().count(category)
+            }
+
+        limit = request.args.get('limit', QUESTIONS_PER_PAGE, type=int)
+        if limit < 1 or limit > MAX_QUESTIONS_PER_PAGE:
+            abort(422, {'message': 'limit must be between 1 and {}'.format(
+                MAX_QUESTIONS_PER_PAGE)})
+
+        # one extra row tells if there is a next page
+        questions = query.filter(Question.id > after).\
+            order_by(Question.id).\
+            limit(limit + 1).\
+            all()
+        has_next = len(questions) > limit
+        questions = questions[:limit]
+
+        pagination = {
+            'next_cursor': questions[-1].id if has_next else None
+        }
+        if request.args.get('count', '').lower() in ('1', 'true'):
+            pagination['total_questions'] = get_quiz_index().count(category)
+
+        return questions, pagination
+
+    '''Returns the quiz index, loading it from the database if needed'''
+    def get_quiz_index():
+        quiz_index = app.extensions['quiz_index']
+
+        if quiz_index.is_stale():
+            quiz_index.load(
+                db.session.query(
+                    Question.id, Question.category, Question.difficulty).
+                yield_per(INDEX_LOAD_BATCH))
+
+        return quiz_index
+
+    '''Returns the search index, loading it from the database if needed'''
+    def get_search_index():
+        search_index = app.extensions['search_index']
+
+        if search_index.is_stale():
+            search_index.load(
+                db.session.query(
+                    Question.id, Question.question, Question.answer).
+                yield_per(INDEX_LOAD_BATCH))
+
+        return search_index
 
     '''
     DONE:
@@ -50,15 +552,23 @@ def create_app(test_config=None):
     for all available categories.
     '''
     @app.route('/categories', methods=['GET'])
+    @cached_response(lambda: ['categories'])
     def get_categories():
         '''Returns all the categories.'''
 
-        categories_json = get_categories_json()
+        categories_json, etag = get_categories_with_etag()
 
-        return jsonify({
+        # answered from the cache, polling clients get a 304
+        response = not_modified(etag)
+        if response is not None:
+            return response
+
+        response = jsonify({
             'success': True,
             'categories': categories_json
         })
+        response.set_etag(etag)
+        return response
 
     '''
     DONE:
@@ -74,26 +584,25 @@ def create_app(test_config=None):
     Clicking on the page numbers should update the questions.
     '''
     @app.route('/questions', methods=['GET'])
+    @cached_response(lambda: ['questions', 'categories'])
     def get_questions():
-        page = request.args.get('page', 1, type=int)
-        selection = Question.query.order_by(Question.id).paginate(
-            page,
-            QUESTIONS_PER_PAGE,
-            False)
-        current_questions = [question.format() for question in selection.items]
+        questions, pagination = paginate_questions(Question.query)
+        current_questions = app.extensions['question_fragments'].\
+            encode_rows(questions)
 
         if len(current_questions) == 0:
             abort(404, {'message': 'questions not found'})
 
         categories_json = get_categories_json()
 
-        return jsonify({
+        response = json_response({
             'success': True,
             'questions': current_questions,
-            'total_questions': selection.total,
             'categories': categories_json,
-            'current_category': None
+            'current_category': None,
+            **pagination
         })
+        return response
 
     '''
     DONE:
@@ -106,13 +615,13 @@ def create_app(test_config=None):
     @app.route('/questions/<int:question_id>', methods=['DELETE'])
     def delete_question(question_id):
         try:
-            question = Question.query.filter(
-                Question.id == question_id).one_or_none()
+            # one DELETE, no SELECT first on Postgres
+            result, = bulk.delete_questions([question_id])
 
-            if question is None:
+            if result['status'] == 404:
                 abort(404, {'message': 'question not found'})
-
-            question.delete()
+            if result['status'] != 200:
+                abort(422, {'message': result['message']})
 
             return jsonify({
                 'success': True,
@@ -153,16 +662,32 @@ def create_app(test_config=None):
         search_term = body.get('searchTerm', None)
 
         if search_term:
-            page = body.get('page', 1)
-            # search for the term in the question
-            search_questions = Question.query.filter(Question.question.ilike(
-                '%' + search_term + '%')).paginate(
-                    page,
-                    QUESTIONS_PER_PAGE,
-                    False)
+            search, error = validate_search(body)
+            if error:
+                abort(422, {'message': error})
+            search_term, page = search
+            # the index only sees the words, so "Movie?" and " movie"
+            # share an entry; any question write outdates them all
+            key = response_cache.key('search', MultiDict({
+                'term': ' '.join(tokenize(search_term)),
+                'page': page
+            }), ['questions'])
+            cached = response_cache.get(key)
+            if cached is not None:
+                return app.response_class(
+                    cached[0], mimetype='application/json')
 
-            questions_json = [question.format()
-                              for question in search_questions.items]
+            # rank the matching ids with the in-process inverted index
+            # and load only the rows of the requested page
+            question_ids = get_search_index().search(search_term)
+            start = (page - 1) * QUESTIONS_PER_PAGE
+            page_ids = question_ids[start:start + QUESTIONS_PER_PAGE]
+
+            questions = app.extensions['question_fragments'].get_many(
+                page_ids, load_questions)
+            questions_json = [questions[question_id]
+                              for question_id in page_ids
+                              if question_id in questions]
 
             if len(questions_json) == 0:
                 abort(
@@ -171,38 +696,26 @@ def create_app(test_config=None):
                         search_term)}
                 )
 
-            return jsonify({
+            response = json_response({
                 'success': True,
                 'questions': questions_json,
-                'total_questions': search_questions.total,
+                'total_questions': len(question_ids),
                 'current_category': None
             })
+            response_cache.set(key, response.get_data(), None)
+            return response
 
         # if not search term, then create question
-        new_question = body.get('question', None)
-        new_answer = body.get('answer', None)
-        new_category = body.get('category', None)
-        new_difficulty = body.get('difficulty', None)
-
-        if not new_question:
-            abort(422, {'message': '{} cannot be blank'.format('question')})
+        new_question, error = validate_question(body)
 
-        if not new_answer:
-            abort(422, {'message': '{} cannot be blank'.format('answer')})
+        if error:
+            abort(422, {'message': error})
 
-        if not new_category:
-            abort(422, {'message': '{} cannot be blank'.format('category')})
-
-        if not new_difficulty:
-            abort(422, {'message': '{} cannot be blank'.format('difficulty')})
+        if new_question['category'] not in get_categories_json():
+            abort(422, {'message': 'category not found'})
 
         try:
-            question = Question(
-                question=new_question,
-                answer=new_answer,
-                category=new_category,
-                difficulty=new_difficulty
-            )
+            question = Question(**new_question)
             question.insert()
 
             return jsonify({
@@ -212,6 +725,198 @@ def create_app(test_config=None):
         except OperationalError:
             abort(422)
 
+    '''
+    Suggests completions of the last word of ?q= for the search box,
+    answered from the search index without a query. Earlier words are
+    kept, so "who disc" suggests "who discovered".
+    '''
+    @app.route('/questions/autocomplete', methods=['GET'])
+    def autocomplete_questions():
+        limit = request.args.get('limit', AUTOCOMPLETE_LIMIT, type=int)
+        if limit < 1 or limit > MAX_AUTOCOMPLETE_LIMIT:
+            abort(422, {'message': 'limit must be between 1 and {}'.format(
+                MAX_AUTOCOMPLETE_LIMIT)})
+
+        words = tokenize(request.args.get('q', ''))
+        suggestions = []
+        if words:
+            *previous, prefix = words
+            suggestions = [' '.join(previous + [word]) for word in
+                           get_search_index().complete(prefix, limit)]
+
+        return jsonify({
+            'success': True,
+            'suggestions': suggestions
+        })
+
+    '''
+    Bulk import of questions as NDJSON or CSV (with a header row).
+    The body is read as a stream, rows are validated like a single new
+    question and inserted in batched transactions. Invalid rows are
+    skipped and reported.
+    '''
+    @app.route('/questions/import', methods=['POST'])
+    def import_questions():
+        format = request.args.get('format', None) or \
+            ('csv' if request.mimetype == 'text/csv' else 'ndjson')
+
+        if format not in bulk.FORMATS:
+            abort(422, {'message': 'format must be one of {}'.format(
+                ', '.join(bulk.FORMATS))})
+
+        lines = io.TextIOWrapper(request.stream, encoding='utf-8', newline='')
+        report = bulk.import_questions(
+            bulk.parse_rows(lines, format), get_categories_json())
+        on_questions_bulk_change(report['categories'])
+
+        return jsonify({
+            'success': True,
+            'imported': report['imported'],
+            'failed': report['failed'],
+            'errors': report['errors']
+        })
+
+    def batch_items(key):
+        '''
+        Returns the list of items under key of the JSON body
+
+        Parameters:
+        key (str): 'questions' or 'ids'
+
+        Returns:
+        list: at most bulk.MAX_BATCH_ITEMS items, aborts with 422 otherwise
+        '''
+        items = (request.get_json(silent=True) or {}).get(key, None)
+
+        if not isinstance(items, list) or not items:
+            abort(422, {'message': '{} must be a non empty list'.format(key)})
+        if len(items) > bulk.MAX_BATCH_ITEMS:
+            abort(422, {'message': 'at most {} {} per batch'.format(
+                bulk.MAX_BATCH_ITEMS, key)})
+
+        return items
+
+    def batch_response(results, done, status):
+        '''Returns the per item results and counts of a batch request'''
+        succeeded = sum(1 for result in results if result['status'] == status)
+
+        return jsonify({
+            'success': True,
+            done: succeeded,
+            'failed': len(results) - succeeded,
+            'results': results
+        })
+
+    '''
+    Batch create, update and delete of questions. The valid items of a
+    request are written in one transaction with one bulk statement,
+    results come back per item in request order. Invalid items (422) and
+    unknown ids (404) are reported without failing the others, a failing
+    transaction fails every valid item.
+    '''
+    @app.route('/questions/batch', methods=['POST'])
+    def create_questions():
+        results = bulk.create_questions(
+            batch_items('questions'), get_categories_json())
+        return batch_response(results, 'created', 201)
+
+    @app.route('/questions/batch', methods=['PATCH'])
+    def update_questions():
+        results = bulk.update_questions(
+            batch_items('questions'), get_categories_json())
+        return batch_response(results, 'updated', 200)
+
+    @app.route('/questions/batch', methods=['DELETE'])
+    def delete_questions():
+        results = bulk.delete_questions(batch_items('ids'))
+        return batch_response(results, 'deleted', 200)
+
+    '''Streams all questions as NDJSON or CSV without loading the table'''
+    @app.route('/questions/export', methods=['GET'])
+    def export_questions():
+        format = request.args.get('format', 'ndjson')
+
+        if format not in bulk.FORMATS:
+            abort(422, {'message': 'format must be one of {}'.format(
+                ', '.join(bulk.FORMATS))})
+
+        return Response(
+            stream_with_context(bulk.export_questions(format)),
+            mimetype=bulk.MIMETYPES[format])
+
+    '''
+    Streams every question as NDJSON, optionally only of a category
+    and/or difficulty. Memory stays flat and there is no per page query.
+    '''
+    @app.route('/questions/stream', methods=['GET'])
+    def stream_questions():
+        filters = {}
+
+        for name in ('category', 'difficulty'):
+            value = request.args.get(name, None)
+            if value is None:
+                continue
+            try:
+                filters[name] = int(value)
+            except ValueError:
+                abort(422, {'message': '{} must be a number'.format(name)})
+
+        return Response(
+            stream_with_context(bulk.export_questions('ndjson', **filters)),
+            mimetype=bulk.MIMETYPES['ndjson'])
+
+    @app.cli.command('migrate')
+    def migrate_command():
+        '''Creates the tables and applies the pending SQL migrations.'''
+        for name in migrate_db():
+            click.echo('applied {}'.format(name))
+        click.echo('database is up to date')
+
+    @app.cli.command('import-questions')
+    @click.argument('file', type=click.File('r', encoding='utf-8'))
+    @click.option('--format', type=click.Choice(bulk.FORMATS), default=None,
+                  help='Defaults to csv for .csv files, else ndjson.')
+    def import_questions_command(file, format):
+        '''Imports questions from an NDJSON or CSV file (- for stdin).'''
+        if format is None:
+            format = 'csv' if file.name.endswith('.csv') else 'ndjson'
+
+        report = bulk.import_questions(
+            bulk.parse_rows(file, format), get_categories_json())
+        on_questions_bulk_change(report['categories'])
+
+        for error in report['errors']:
+            click.echo('line {line}: {message}'.format(**error), err=True)
+        click.echo('imported {imported}, failed {failed}'.format(**report))
+
+    @app.cli.command('generate-decks')
+    @click.option('--decks', type=click.IntRange(min=1),
+                  default=DECKS_PER_CATEGORY, help='Decks per category.')
+    @click.option('--output', default=None,
+                  help='Decks file, defaults to QUIZ_DECKS_PATH.')
+    @click.option('--seed', type=int, default=None)
+    def generate_decks_command(decks, output, seed):
+        '''Precomputes shuffled quiz decks of every category.'''
+        path = output or app.config['QUIZ_DECKS_PATH']
+        if not path:
+            raise click.UsageError('--output or QUIZ_DECKS_PATH is needed')
+
+        sizes = generate_decks(path, db.session.query(
+            Question.id, Question.category).yield_per(INDEX_LOAD_BATCH),
+            decks, seed)
+        click.echo('wrote {} decks of {} categories ({} questions) to {}'
+                   .format(decks, len(sizes) - 1, sizes[ALL_CATEGORIES], path))
+
+    @app.cli.command('export-questions')
+    @click.argument('file', type=click.File('w', encoding='utf-8'),
+                    default='-')
+    @click.option('--format', type=click.Choice(bulk.FORMATS),
+                  default='ndjson')
+    def export_questions_command(file, format):
+        '''Exports all questions as NDJSON or CSV to a file (- for stdout).'''
+        for chunk in bulk.export_questions(format):
+            file.write(chunk)
+
     '''
     DONE:
     Create a GET endpoint to get questions based on category.
@@ -221,31 +926,26 @@ def create_app(test_config=None):
     category to be shown.
     '''
     @app.route('/categories/<int:category_id>/questions', methods=['GET'])
+    @cached_response(lambda category_id: [
+        category_tag(category_id), 'categories'])
     def get_questions_by_category(category_id):
-        current_category = Category.\
-            query.filter(Category.id == category_id).one_or_none()
-
-        if not current_category:
+        if category_id not in get_categories_json():
             abort(404, {'message': 'category not found'})
 
-        page = request.args.get('page', 1, type=int)
-        selection = Question.query.\
-            filter(Question.category == category_id).\
-            order_by(Question.id).\
-            paginate(
-                page,
-                QUESTIONS_PER_PAGE,
-                False)
-        current_questions = [question.format() for question in selection.items]
+        questions, pagination = paginate_questions(
+            Question.query.filter(Question.category == category_id),
+            category_id)
+        current_questions = app.extensions['question_fragments'].\
+            encode_rows(questions)
 
         if len(current_questions) == 0:
             abort(404, {'message': 'questions not found'})
 
-        return jsonify({
+        return json_response({
             'success': True,
             'questions': current_questions,
-            'total_questions': selection.total,
-            'current_category': category_id
+            'current_category': category_id,
+            **pagination
         })
 
     '''
@@ -270,44 +970,251 @@ def create_app(test_config=None):
         if body:
             previous_questions = body.get('previous_questions', None)
             quiz_category = body.get('quiz_category', None)
+            difficulty = body.get('difficulty', None)
+            count = body.get('count', None)
         else:
             previous_questions = None
             quiz_category = None
+            difficulty = None
+            count = None
 
-        if quiz_category:
-            if int(quiz_category['id']) == 0:
-                quiz_category = None
+        try:
+            category_id = int(quiz_category['id']) if quiz_category \
+                else ALL_CATEGORIES
+            previous_questions = [int(question_id)
+                                  for question_id in previous_questions or []]
+        except (KeyError, TypeError, ValueError):
+            abort(422, {'message': 'invalid quiz_category or '
+                                   'previous_questions'})
 
-        if not quiz_category:
-            if not previous_questions:
-                quiz_questions = Question.query.all()
-            else:
-                quiz_questions = Question.query.filter(
-                    Question.id.notin_(previous_questions)
-                ).all()
+        # "count" asks for a batch of distinct questions in one request
+        if count is not None and (
+                not isinstance(count, int) or isinstance(count, bool) or
+                count < 1 or count > MAX_QUIZ_QUESTIONS):
+            abort(422, {'message': 'count must be between 1 and {}'.format(
+                MAX_QUIZ_QUESTIONS)})
+
+        # a client sending "deck" walks a precomputed deck, if any
+        decks = app.extensions['decks']
+        wants_deck = bool(body) and 'deck' in body
+        if wants_deck and difficulty is None and decks is not None and \
+                decks.count(category_id):
+            questions, deck = draw_from_deck(
+                decks, category_id, body['deck'], previous_questions, count)
+            return quiz_response(questions, count, deck)
+
+        # draw from the in-process id index and load only the drawn rows,
+        # if they have not been encoded recently
+        quiz_index = get_quiz_index()
+        questions = []
+        exclude = list(previous_questions)
+
+        while len(questions) < (count or 1):
+            try:
+                question_ids = draw(quiz_index, category_id, exclude,
+                                    (count or 1) - len(questions), difficulty)
+            except (TypeError, ValueError):
+                abort(422, {'message': 'invalid difficulty'})
+            if not question_ids:
+                break
+
+            fragments = app.extensions['question_fragments'].get_many(
+                question_ids, load_questions)
+            for question_id in question_ids:
+                exclude.append(question_id)
+                if question_id in fragments:
+                    questions.append(fragments[question_id])
+                else:
+                    # deleted by another worker since the index was loaded
+                    quiz_index.remove(question_id)
+
+        return quiz_response(questions, count, None if wants_deck else False)
+
+    '''
+    Returns the quiz response: the questions if count was given, else
+    the first one. deck is left out if False.
+    '''
+    def quiz_response(questions, count, deck=False):
+        payload = {'success': True}
+        if count is not None:
+            payload['questions'] = questions
         else:
-            if not previous_questions:
-                quiz_questions = Question.query.filter(
-                    Question.category == quiz_category['id']
-                ).all()
+            payload['question'] = questions[0] if questions else None
+        if deck is not False:
+            payload['deck'] = deck
+
+        return json_response(payload)
+
+    '''
+    Returns the next (count or 1) questions of a deck and the deck
+    position to send next. deck is the one of the previous response,
+    None or a deck of older decks starts a random deck of category.
+    Questions in previous_questions or deleted since the decks were
+    generated are skipped, every other step is one array read.
+    '''
+    def draw_from_deck(decks, category, deck, previous_questions, count):
+        generation = decks.generation
+        try:
+            if isinstance(deck, dict) and \
+                    deck.get('generation') == generation:
+                number, position = int(deck['id']), int(deck['position'])
             else:
-                quiz_questions = Question.query.filter(
-                    Question.category == quiz_category['id']
-                ).filter(
-                    Question.id.notin_(previous_questions)
-                ).all()
-
-        if quiz_questions:
-            quiz_questions_json = [question.format()
-                                   for question in quiz_questions]
-            random_question = quiz_questions_json[random.randint(
-                0, len(quiz_questions_json) - 1)]
+                number, position = decks.random_deck(category), 0
+        except (KeyError, TypeError, ValueError):
+            abort(422, {'message': 'invalid deck'})
+        if not 0 <= number < decks.count(category) or position < 0:
+            abort(422, {'message': 'invalid deck'})
+
+        played = set(previous_questions)
+        questions = []
+        while len(questions) < (count or 1):
+            question_ids = []
+            while len(question_ids) < (count or 1) - len(questions):
+                question_id = decks.question_id(category, number, position)
+                if question_id is None:
+                    break
+                position += 1
+                if question_id not in played:
+                    question_ids.append(question_id)
+            if not question_ids:
+                break
+
+            fragments = app.extensions['question_fragments'].get_many(
+                question_ids, load_questions)
+            questions.extend(fragments[question_id]
+                             for question_id in question_ids
+                             if question_id in fragments)
+
+        return questions, {
+            'id': number,
+            'position': position,
+            'generation': generation
+        }
+
+    '''
+    Quiz sessions keep the questions left to play on the server,
+    so the client only sends the session id for every next question.
+    '''
+    @app.route('/quizzes/sessions', methods=['POST'])
+    def create_quiz_session():
+        body = request.get_json() or {}
+        quiz_category = body.get('quiz_category', None)
+
+        try:
+            category_id = int(quiz_category['id']) if quiz_category \
+                else ALL_CATEGORIES
+        except (KeyError, TypeError, ValueError):
+            abort(422, {'message': 'invalid quiz_category'})
+
+        decks = app.extensions['decks']
+        if decks is not None and decks.count(category_id):
+            quiz_session = QuizSession.from_deck(
+                category_id, decks.generation, decks.random_deck(category_id),
+                decks.length(category_id))
         else:
-            random_question = None
+            quiz_session = QuizSession(
+                category_id, get_quiz_index().count(category_id))
+        app.extensions['quiz_sessions'].set(quiz_session.id, quiz_session)
+
+        return jsonify({
+            'success': True,
+            'session_id': quiz_session.id,
+            'quiz_category': category_id,
+            'total_questions': quiz_session.total
+        })
+
+    @app.route('/quizzes/sessions/<session_id>/next', methods=['POST'])
+    def get_quiz_session_question(session_id):
+        quiz_sessions = app.extensions['quiz_sessions']
+        quiz_session = quiz_sessions.get(session_id)
+
+        if quiz_session is None:
+            abort(404, {'message': 'quiz session not found'})
+
+        decks = app.extensions['decks']
+        if quiz_session.deck is not None and (
+                decks is None or decks.generation != quiz_session.deck[0]):
+            # the decks were replaced, go on with the questions left
+            quiz_session.leave_deck(
+                get_quiz_index().count(quiz_session.category))
+
+        quiz_index = get_quiz_index()
+        question = None
+        while question is None:
+            question_id = quiz_session.next_id(quiz_index, decks)
+            if question_id is None:
+                break
+            # skips questions deleted since the session was created
+            question = app.extensions['question_fragments'].get_many(
+                [question_id], load_questions).get(question_id)
+
+        # stores the session again to refresh its TTL
+        quiz_sessions.set(session_id, quiz_session)
+
+        return json_response({
+            'success': True,
+            'question': question,
+            'played': quiz_session.played
+        })
+
+    @app.route('/quizzes/sessions/<session_id>', methods=['DELETE'])
+    def delete_quiz_session(session_id):
+        quiz_sessions = app.extensions['quiz_sessions']
+
+        if quiz_sessions.get(session_id) is None:
+            abort(404, {'message': 'quiz session not found'})
+
+        quiz_sessions.delete(session_id)
+
+        return jsonify({
+            'success': True,
+            'deleted': session_id
+        })
+
+    '''
+    Number of questions per category and difficulty, counted by the
+    quiz index of this worker.
+    '''
+    @app.route('/stats', methods=['GET'])
+    def get_stats():
+        quiz_index = get_quiz_index()
+        stats = quiz_index.stats()
+
+        return json_response({
+            'success': True,
+            'total_questions': quiz_index.count(),
+            'difficulties': stats.get(ALL_CATEGORIES, {}),
+            'categories': {category_id: {
+                'type': category_type,
+                'total_questions': quiz_index.count(category_id),
+                'difficulties': stats.get(category_id, {})
+            } for category_id, category_type in get_categories_json().items()}
+        })
+
+    '''Health, replication lag and reads of the read replicas'''
+    @app.route('/metrics/replicas', methods=['GET'])
+    def get_replica_metrics():
+        replicas = app.extensions['replicas']
+
+        return jsonify({
+            'success': True,
+            'replicas': replicas.status() if replicas is not None else {}
+        })
 
+    '''Connection pool state and wait/timeout counters of this worker'''
+    @app.route('/metrics/pool', methods=['GET'])
+    def get_pool_metrics():
         return jsonify({
             'success': True,
-            'question': random_question
+            'pool': pool_metrics(db.engine)
+        })
+
+    '''Queries and timings per route of this worker, means per request'''
+    @app.route('/metrics/requests', methods=['GET'])
+    def get_request_metrics():
+        return jsonify({
+            'success': True,
+            'routes': app.extensions['route_metrics'].snapshot()
         })
 
     @app.errorhandler(400)
@@ -355,6 +1262,39 @@ def create_app(test_config=None):
             'message': get_error_message(error, 'internal server error')
         }), 500
 
+    @app.errorhandler(429)
+    def too_many_requests(error):
+        return with_retry_after(jsonify({
+            'success': False,
+            'error': 429,
+            'message': get_error_message(error, 'too many requests')
+        }), error), 429
+
+    @app.errorhandler(503)
+    def service_unavailable(error):
+        return with_retry_after(jsonify({
+            'success': False,
+            'error': 503,
+            'message': get_error_message(error, 'service unavailable')
+        }), error), 503
+
+    '''Sets Retry-After to the retry_after seconds of error.description'''
+    def with_retry_after(response, error):
+        if isinstance(error.description, dict) and \
+                'retry_after' in error.description:
+            response.headers['Retry-After'] = str(
+                math.ceil(error.description['retry_after']))
+        return response
+
+    @app.errorhandler(PoolTimeoutError)
+    def pool_timeout(error):
+        '''No database connection became free in DB_POOL_TIMEOUT'''
+        return jsonify({
+            'success': False,
+            'error': 503,
+            'message': 'database busy, try again later'
+        }), 503
+
     def get_error_message(error, default_message):
         '''
         Returns if there is any error message provided in
@@ -0,0 +1,443 @@
+'''
+Async serving mode.
+
+Serves the /categories, /questions and /quizzes routes of the Flask app
+with the same JSON contracts from an ASGI app, on top of an asyncpg
+connection pool, so a worker keeps serving other requests while it
+waits on Postgres. Needs the packages of requirements-async.txt:
+
+    uvicorn flaskr.asgi:app --workers 4
+
+The database and pool use the same DATABASE_URL and DB_POOL_* settings
+as the Flask app, see models.POOL_SETTINGS.
+'''
+import asyncio
+
+import asyncpg
+from starlette.applications import Starlette
+from starlette.exceptions import HTTPException
+from starlette.middleware import Middleware
+from starlette.responses import Response
+from starlette.routing import Route
+
+from models import database_path, get_setting
+from . import QUESTIONS_PER_PAGE, MAX_QUESTIONS_PER_PAGE, \
+    MAX_QUIZ_QUESTIONS, QUIZ_INDEX_MAX_AGE, SEARCH_INDEX_MAX_AGE, \
+    CATEGORY_CACHE_MAX_AGE
+from .category_cache import CategoryCache
+from .difficulty import draw
+from .quiz_index import QuizIndex, ALL_CATEGORIES
+from .search_index import SearchIndex
+from .serialization import default_dumps
+from .validation import validate_question, validate_search
+
+QUESTION_COLUMNS = 'id, question, answer, category, difficulty'
+
+ERROR_MESSAGES = {
+    400: 'bad request',
+    404: 'resource not found',
+    405: 'method not allowed',
+    422: 'unprocessable entity',
+    500: 'internal server error',
+    503: 'service unavailable'
+}
+
+
+class APIError(Exception):
+    '''Error answered with the JSON error body of the Flask app'''
+
+    def __init__(self, status_code, message=None):
+        super().__init__(message)
+        self.status_code = status_code
+        self.message = message or ERROR_MESSAGES.get(status_code, 'error')
+
+
+def abort(status_code, message=None):
+    raise APIError(status_code, message)
+
+
+class JSONResponse(Response):
+    '''Encodes the body like Flask jsonify, with orjson if installed'''
+    media_type = 'application/json'
+    dumps = staticmethod(default_dumps())
+
+    def render(self, content):
+        return self.dumps(content) + b'\n'
+
+
+class CORSHeadersMiddleware:
+    '''Adds the Access-Control-Allow headers of the Flask after_request'''
+    headers = [
+        (b'access-control-allow-headers', b'Content-Type,Authorization,true'),
+        (b'access-control-allow-methods', b'GET,PATCH,POST,DELETE,OPTIONS')
+    ]
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            return await self.app(scope, receive, send)
+
+        async def send_with_headers(message):
+            if message['type'] == 'http.response.start':
+                message['headers'] = \
+                    list(message.get('headers', [])) + self.headers
+            await send(message)
+
+        await self.app(scope, receive, send_with_headers)
+
+
+def int_arg(args, name, default=None):
+    '''Returns a query argument as int, default if missing or invalid'''
+    try:
+        return int(args[name])
+    except (KeyError, ValueError):
+        return default
+
+
+def create_asgi_app(config=None):
+    config = dict(config or {})
+    config.setdefault('DATABASE_URL', database_path)
+
+    quiz_index = QuizIndex(max_age=QUIZ_INDEX_MAX_AGE)
+    search_index = SearchIndex(max_age=SEARCH_INDEX_MAX_AGE)
+    category_cache = CategoryCache(max_age=CATEGORY_CACHE_MAX_AGE)
+    state = {'pool': None, 'category_rows': []}
+
+    '''Returns the connection pool, created on first use'''
+    async def get_pool():
+        if state['pool'] is None:
+            # asyncpg prepares and caches statements, which PgBouncer
+            # in transaction pooling mode does not support
+            statement_cache_size = 0 if get_setting(
+                config, 'DB_PGBOUNCER') else 100
+            state['pool'] = asyncio.ensure_future(asyncpg.create_pool(
+                config['DATABASE_URL'].replace('+psycopg2', ''),
+                min_size=1,
+                max_size=get_setting(config, 'DB_POOL_SIZE') +
+                get_setting(config, 'DB_MAX_OVERFLOW'),
+                max_inactive_connection_lifetime=get_setting(
+                    config, 'DB_POOL_RECYCLE'),
+                statement_cache_size=statement_cache_size))
+
+        return await state['pool']
+
+    '''Runs query on a pooled connection, method is an asyncpg method'''
+    async def query(method, sql, *args):
+        pool = await get_pool()
+        try:
+            async with pool.acquire(
+                    timeout=get_setting(config, 'DB_POOL_TIMEOUT')) \
+                    as connection:
+                return await getattr(connection, method)(sql, *args)
+        except asyncio.TimeoutError:
+            abort(503, 'database busy, try again later')
+
+    async def close_pool():
+        if state['pool'] is not None and state['pool'].done():
+            await state['pool'].result().close()
+
+    '''Returns the cached categories dict'''
+    async def get_categories_json():
+        if category_cache.is_stale():
+            state['category_rows'] = await query(
+                'fetch', 'SELECT id, type FROM categories')
+
+        category_map, _ = category_cache.get(lambda: state['category_rows'])
+        if not category_map:
+            abort(404, 'no category found')
+
+        return category_map
+
+    async def get_quiz_index():
+        if quiz_index.is_stale():
+            quiz_index.load(await query(
+                'fetch', 'SELECT id, category, difficulty FROM questions'))
+        return quiz_index
+
+    async def get_search_index():
+        if search_index.is_stale():
+            search_index.load(await query(
+                'fetch', 'SELECT id, question, answer FROM questions'))
+        return search_index
+
+    async def get_json(request):
+        '''Returns the JSON body like Flask request.get_json()'''
+        if request.headers.get('content-type', '').split(';')[0] != \
+                'application/json':
+            return None
+        try:
+            return await request.json()
+        except ValueError:
+            abort(400, 'invalid body JSON')
+
+    '''
+    Returns a page of questions and the pagination fields, see
+    paginate_questions() of the Flask app.
+    '''
+    async def paginate_questions(request, category_id=None):
+        args = request.query_params
+        where, params = '', []
+        if category_id is not None:
+            where, params = 'WHERE category = $1', [category_id]
+
+        after = int_arg(args, 'after')
+
+        if after is None:
+            page = max(int_arg(args, 'page', 1), 1)
+            questions = await query(
+                'fetch',
+                'SELECT {} FROM questions {} ORDER BY id LIMIT {} OFFSET {}'.
+                format(QUESTION_COLUMNS, where, QUESTIONS_PER_PAGE,
+                       (page - 1) * QUESTIONS_PER_PAGE),
+                *params)
+            index = await get_quiz_index()
+            return questions, {
+                'total_questions': index.count(category_id or ALL_CATEGORIES)
+            }
+
+        limit = int_arg(args, 'limit', QUESTIONS_PER_PAGE)
+        if limit < 1 or limit > MAX_QUESTIONS_PER_PAGE:
+            abort(422, 'limit must be between 1 and {}'.format(
+                MAX_QUESTIONS_PER_PAGE))
+
+        questions = await query(
+            'fetch',
+            'SELECT {} FROM questions {} {} id > ${} ORDER BY id LIMIT {}'.
+            format(QUESTION_COLUMNS, where, 'AND' if where else 'WHERE',
+                   len(params) + 1, limit + 1),
+            *params, after)
+        has_next = len(questions) > limit
+        questions = questions[:limit]
+
+        pagination = {
+            'next_cursor': questions[-1]['id'] if has_next else None
+        }
+        if args.get('count', '').lower() in ('1', 'true'):
+            index = await get_quiz_index()
+            pagination['total_questions'] = index.count(
+                category_id or ALL_CATEGORIES)
+
+        return questions, pagination
+
+    async def get_categories(request):
+        return JSONResponse({
+            'success': True,
+            'categories': await get_categories_json()
+        })
+
+    async def get_questions(request):
+        questions, pagination = await paginate_questions(request)
+
+        if len(questions) == 0:
+            abort(404, 'questions not found')
+
+        return JSONResponse({
+            'success': True,
+            'questions': [dict(question) for question in questions],
+            'categories': await get_categories_json(),
+            'current_category': None,
+            **pagination
+        })
+
+    async def delete_question(request):
+        question_id = request.path_params['question_id']
+
+        # a single statement instead of a SELECT and a DELETE
+        deleted = await query(
+            'fetchval', 'DELETE FROM questions WHERE id = $1 RETURNING id',
+            question_id)
+
+        if deleted is None:
+            abort(404, 'question not found')
+
+        quiz_index.remove(question_id)
+        search_index.remove(question_id)
+
+        return JSONResponse({
+            'success': True,
+            'deleted': question_id
+        })
+
+    async def create_or_search_question(request):
+        body = await get_json(request)
+
+        if not body:
+            abort(422, 'invalid body JSON')
+
+        search_term = body.get('searchTerm', None)
+
+        if search_term:
+            search, error = validate_search(body)
+            if error:
+                abort(422, error)
+            search_term, page = search
+            question_ids = (await get_search_index()).search(search_term)
+            start = (page - 1) * QUESTIONS_PER_PAGE
+            page_ids = question_ids[start:start + QUESTIONS_PER_PAGE]
+
+            questions = {}
+            if page_ids:
+                questions = {question['id']: dict(question) for question in
+                             await query(
+                                 'fetch',
+                                 'SELECT {} FROM questions '
+                                 'WHERE id = any($1::int[])'.format(
+                                     QUESTION_COLUMNS),
+                                 page_ids)}
+
+            questions_json = [questions[question_id]
+                              for question_id in page_ids
+                              if question_id in questions]
+
+            if len(questions_json) == 0:
+                abort(404, 'no questions found with term - {}'.format(
+                    search_term))
+
+            return JSONResponse({
+                'success': True,
+                'questions': questions_json,
+                'total_questions': len(question_ids),
+                'current_category': None
+            })
+
+        new_question, error = validate_question(body)
+
+        if error:
+            abort(422, error)
+
+        if new_question['category'] not in await get_categories_json():
+            abort(422, 'category not found')
+
+        question_id = await query(
+            'fetchval',
+            'INSERT INTO questions (question, answer, category, difficulty) '
+            'VALUES ($1, $2, $3, $4) RETURNING id',
+            new_question['question'], new_question['answer'],
+            new_question['category'], new_question['difficulty'])
+
+        quiz_index.add(question_id, new_question['category'],
+                       new_question['difficulty'])
+        search_index.add(
+            question_id, new_question['question'], new_question['answer'])
+
+        return JSONResponse({
+            'success': True,
+            'created': question_id
+        })
+
+    async def get_questions_by_category(request):
+        category_id = request.path_params['category_id']
+
+        if category_id not in await get_categories_json():
+            abort(404, 'category not found')
+
+        questions, pagination = await paginate_questions(
+            request, category_id)
+
+        if len(questions) == 0:
+            abort(404, 'questions not found')
+
+        return JSONResponse({
+            'success': True,
+            'questions': [dict(question) for question in questions],
+            'current_category': category_id,
+            **pagination
+        })
+
+    async def get_quiz(request):
+        body = await get_json(request) or {}
+        previous_questions = body.get('previous_questions', None)
+        quiz_category = body.get('quiz_category', None)
+
+        try:
+            category_id = int(quiz_category['id']) if quiz_category \
+                else ALL_CATEGORIES
+            previous_questions = [int(question_id)
+                                  for question_id in previous_questions or []]
+        except (KeyError, TypeError, ValueError):
+            abort(422, 'invalid quiz_category or previous_questions')
+
+        count = body.get('count', None)
+        if count is not None and (
+                not isinstance(count, int) or isinstance(count, bool) or
+                count < 1 or count > MAX_QUIZ_QUESTIONS):
+            abort(422, 'count must be between 1 and {}'.format(
+                MAX_QUIZ_QUESTIONS))
+
+        index = await get_quiz_index()
+        questions = []
+        exclude = list(previous_questions)
+
+        while len(questions) < (count or 1):
+            try:
+                question_ids = draw(index, category_id, exclude,
+                                    (count or 1) - len(questions),
+                                    body.get('difficulty', None))
+            except (TypeError, ValueError):
+                abort(422, 'invalid difficulty')
+            if not question_ids:
+                break
+
+            rows = {row['id']: dict(row) for row in await query(
+                'fetch',
+                'SELECT {} FROM questions WHERE id = any($1::int[])'.format(
+                    QUESTION_COLUMNS),
+                question_ids)}
+            for question_id in question_ids:
+                exclude.append(question_id)
+                if question_id in rows:
+                    questions.append(rows[question_id])
+                else:
+                    # deleted by another worker since the index was loaded
+                    index.remove(question_id)
+
+        if count is not None:
+            return JSONResponse({
+                'success': True,
+                'questions': questions
+            })
+
+        return JSONResponse({
+            'success': True,
+            'question': questions[0] if questions else None
+        })
+
+    async def api_error(request, error):
+        return JSONResponse({
+            'success': False,
+            'error': error.status_code,
+            'message': error.message
+        }, status_code=error.status_code)
+
+    async def http_error(request, error):
+        return await api_error(request, APIError(error.status_code))
+
+    async def server_error(request, error):
+        return await api_error(request, APIError(500))
+
+    app = Starlette(
+        routes=[
+            Route('/categories', get_categories, methods=['GET']),
+            Route('/questions', get_questions, methods=['GET']),
+            Route('/questions', create_or_search_question,
+                  methods=['POST']),
+            Route('/questions/{question_id:int}', delete_question,
+                  methods=['DELETE']),
+            Route('/categories/{category_id:int}/questions',
+                  get_questions_by_category, methods=['GET']),
+            Route('/quizzes', get_quiz, methods=['POST'])
+        ],
+        exception_handlers={
+            APIError: api_error,
+            HTTPException: http_error,
+            500: server_error
+        },
+        middleware=[Middleware(CORSHeadersMiddleware)],
+        on_shutdown=[close_pool])
+
+    return app
+
+
+app = create_asgi_app()
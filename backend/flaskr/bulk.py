@@ -0,0 +1,386 @@
+import csv
+import io
+import json
+
+from sqlalchemy import bindparam, text
+from sqlalchemy.exc import SQLAlchemyError
+
+from models import db, Question, notify_question_listeners_many
+from .serialization import QUESTION_COLUMNS, question_json
+from .validation import QUESTION_FIELDS, validate_question
+
+IMPORT_BATCH_SIZE = 5000
+EXPORT_BATCH_SIZE = 1000
+# items of one batch create, update or delete request
+MAX_BATCH_ITEMS = 1000
+# errors listed in an import report, the rest is only counted
+MAX_REPORTED_ERRORS = 100
+
+FORMATS = ('ndjson', 'csv')
+MIMETYPES = {
+    'ndjson': 'application/x-ndjson',
+    'csv': 'text/csv'
+}
+
+
+def parse_rows(lines, format):
+    '''
+    Parses question rows from an iterable of text lines
+
+    Parameters:
+    lines (iterable): NDJSON lines or CSV lines with a header row
+    format (str): 'ndjson' or 'csv'
+
+    Returns:
+    generator: (line number, row dict or None, error message or None)
+    '''
+    if format == 'csv':
+        reader = csv.DictReader(lines)
+        for row in reader:
+            yield reader.line_num, row, None
+        return
+
+    for line_number, line in enumerate(lines, 1):
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError:
+            yield line_number, None, 'invalid JSON'
+            continue
+        if not isinstance(row, dict):
+            yield line_number, None, 'row must be a JSON object'
+            continue
+        yield line_number, row, None
+
+
+def import_questions(rows, categories=None, batch_size=IMPORT_BATCH_SIZE):
+    '''
+    Validates and inserts parsed question rows in batches
+
+    Every batch is inserted with one executemany statement and
+    committed in its own transaction, invalid rows are skipped.
+
+    Parameters:
+    rows (iterable): output of parse_rows()
+    categories (container): known category ids, rows of other
+        categories are rejected if given
+    batch_size (int): rows inserted per transaction
+
+    Returns:
+    dict: imported and failed counts, errors and changed categories
+    '''
+    report = {
+        'imported': 0,
+        'failed': 0,
+        'errors': [],
+        'categories': set()
+    }
+    batch = []
+
+    def add_error(line_number, message):
+        report['failed'] += 1
+        if len(report['errors']) < MAX_REPORTED_ERRORS:
+            report['errors'].append({'line': line_number, 'message': message})
+
+    for line_number, row, error in rows:
+        if error is None:
+            row, error = validate_question(row)
+        if error is None and categories is not None and \
+                row['category'] not in categories:
+            error = 'category not found'
+        if error is not None:
+            add_error(line_number, error)
+            continue
+
+        batch.append((line_number, row))
+        if len(batch) >= batch_size:
+            _insert_batch(batch, report, add_error)
+            batch = []
+
+    if batch:
+        _insert_batch(batch, report, add_error)
+
+    return report
+
+
+def _insert_batch(batch, report, add_error):
+    '''Inserts a batch in one transaction, a failing batch is skipped'''
+    rows = [row for _, row in batch]
+
+    try:
+        db.session.execute(Question.__table__.insert(), rows)
+        db.session.commit()
+    except SQLAlchemyError as error:
+        db.session.rollback()
+        add_error(batch[0][0], 'batch of {} rows failed: {}'.format(
+            len(batch), error.__class__.__name__))
+        report['failed'] += len(batch) - 1
+        return
+
+    report['imported'] += len(batch)
+    report['categories'].update(row['category'] for row in rows)
+
+
+def create_questions(items, categories):
+    '''
+    Inserts the valid items in one transaction
+
+    All rows go in with one executemany statement. On Postgres the ids
+    are taken from the sequence first. SQLite gives the rows the next
+    ids in order and the transaction holds the write lock from the
+    first row on, so the ids are read back as the largest ones. If the
+    transaction fails, none of the items is created.
+
+    Parameters:
+    items (list): question dicts like the body of POST /questions
+    categories (container): known category ids
+
+    Returns:
+    list: result per item, {'id', 'status': 201} or
+        {'status': 422, 'message'}
+    '''
+    results = [None] * len(items)
+    pending = []
+
+    for position, item in enumerate(items):
+        row, error = validate_question(item) if isinstance(item, dict) \
+            else (None, 'question must be a JSON object')
+        if error is None and row['category'] not in categories:
+            error = 'category not found'
+        if error is not None:
+            results[position] = _failed(error)
+            continue
+        pending.append((position, row))
+
+    rows = [row for _, row in pending]
+    ids = []
+
+    def insert():
+        if _is_postgres():
+            ids.extend(question_id for question_id, in db.session.execute(
+                text("SELECT nextval(pg_get_serial_sequence("
+                     "'questions', 'id')) FROM generate_series(1, :count)"),
+                {'count': len(rows)}))
+            db.session.execute(Question.__table__.insert(), [
+                dict(row, id=question_id)
+                for row, question_id in zip(rows, ids)])
+        else:
+            db.session.execute(Question.__table__.insert(), rows)
+            ids.extend(reversed([question_id for question_id, in
+                                 db.session.query(Question.id).
+                                 order_by(Question.id.desc()).
+                                 limit(len(rows))]))
+
+    if rows and _commit(insert, pending, results):
+        for (position, row), question_id in zip(pending, ids):
+            results[position] = {'id': question_id, 'status': 201}
+        notify_question_listeners_many('insert', [
+            dict(row, id=question_id)
+            for (_, row), question_id in zip(pending, ids)])
+
+    return results
+
+
+def update_questions(items, categories):
+    '''
+    Applies partial updates of the valid items in one transaction
+
+    The current rows are read with one SELECT, merged with the changes
+    and validated, then written with one executemany UPDATE.
+
+    Parameters:
+    items (list): dicts with the id and the fields to change
+    categories (container): known category ids
+
+    Returns:
+    list: result per item, {'id', 'status': 200}, {'id', 'status': 404}
+        or {'status': 422, 'message'}
+    '''
+    results = [None] * len(items)
+    ids = set()
+
+    for position, item in enumerate(items):
+        question_id = item.get('id') if isinstance(item, dict) else None
+        if not isinstance(question_id, int) or isinstance(question_id, bool):
+            results[position] = _failed('id must be a number')
+        elif question_id in ids:
+            results[position] = _failed('duplicate id')
+        else:
+            ids.add(question_id)
+
+    current = {row.id: question_json(row) for row in
+               db.session.query(*QUESTION_COLUMNS).filter(
+                   Question.id.in_(ids))} if ids else {}
+    pending = []
+
+    for position, item in enumerate(items):
+        if results[position] is not None:
+            continue
+        if item['id'] not in current:
+            results[position] = {'id': item['id'], 'status': 404}
+            continue
+
+        changes = {field: item[field] for field in QUESTION_FIELDS
+                   if field in item}
+        row, error = validate_question(dict(current[item['id']], **changes))
+        if error is None and row['category'] not in categories:
+            error = 'category not found'
+        if error is not None:
+            results[position] = _failed(error)
+            continue
+        row['id'] = item['id']
+        pending.append((position, row))
+
+    table = Question.__table__
+    statement = table.update().\
+        where(table.c.id == bindparam('question_id')).\
+        values({field: bindparam('new_' + field)
+                for field in QUESTION_FIELDS})
+
+    def update():
+        db.session.execute(statement, [
+            dict({'new_' + field: row[field] for field in QUESTION_FIELDS},
+                 question_id=row['id'])
+            for _, row in pending])
+
+    if pending and _commit(update, pending, results):
+        for position, row in pending:
+            results[position] = {'id': row['id'], 'status': 200}
+        notify_question_listeners_many(
+            'update', [row for _, row in pending],
+            [current[row['id']] for _, row in pending])
+
+    return results
+
+
+def delete_questions(ids):
+    '''
+    Deletes questions by id with one statement
+
+    On Postgres the deleted rows come back through RETURNING, other
+    databases read them with a SELECT in the same transaction.
+
+    Parameters:
+    ids (list): question ids
+
+    Returns:
+    list: result per id, {'id', 'status': 200}, {'id', 'status': 404}
+        or {'id', 'status': 422, 'message'}
+    '''
+    results = [None] * len(ids)
+    pending = []
+
+    for position, question_id in enumerate(ids):
+        if not isinstance(question_id, int) or isinstance(question_id, bool):
+            results[position] = _failed('id must be a number')
+        else:
+            pending.append((position, question_id))
+
+    wanted = {question_id for _, question_id in pending}
+    deleted = {}
+    table = Question.__table__
+    statement = table.delete().where(table.c.id.in_(wanted))
+
+    def delete():
+        if _is_postgres():
+            rows = db.session.execute(statement.returning(*table.c))
+        else:
+            rows = db.session.query(*QUESTION_COLUMNS).filter(
+                Question.id.in_(wanted)).all()
+            db.session.execute(statement)
+        deleted.update((row[0], question_json(row)) for row in rows)
+
+    if pending and _commit(delete, pending, results):
+        for position, question_id in pending:
+            results[position] = {
+                'id': question_id,
+                'status': 200 if question_id in deleted else 404
+            }
+        if deleted:
+            notify_question_listeners_many('delete', list(deleted.values()))
+
+    return results
+
+
+def _is_postgres():
+    return db.engine.dialect.name == 'postgresql'
+
+
+def _failed(message):
+    return {'status': 422, 'message': message}
+
+
+def _commit(statements, pending, results):
+    '''
+    Runs statements and commits, a failing transaction fails all pending
+    items
+
+    Parameters:
+    statements (callable): runs the statements of the transaction
+    pending (list): (position, item) tuples, an item is a question id
+        or a row, the result of a failed item keeps its id if any
+    results (list): result per position
+
+    Returns:
+    bool: True if committed
+    '''
+    try:
+        statements()
+        db.session.commit()
+    except SQLAlchemyError as error:
+        db.session.rollback()
+        message = 'batch failed: {}'.format(error.__class__.__name__)
+        for position, item in pending:
+            results[position] = _failed(message)
+            question_id = item if isinstance(item, int) else item.get('id')
+            if question_id is not None:
+                results[position]['id'] = question_id
+        return False
+    return True
+
+
+def export_questions(format, category=None, difficulty=None,
+                     batch_size=EXPORT_BATCH_SIZE):
+    '''
+    Yields the questions ordered by id as NDJSON or CSV text chunks
+
+    Rows are read through a server side cursor, so memory use does not
+    grow with the table.
+
+    Parameters:
+    format (str): 'ndjson' or 'csv'
+    category (int): only questions of this category if given
+    difficulty (int): only questions of this difficulty if given
+    '''
+    columns = ('id',) + QUESTION_FIELDS
+    query = db.session.query(
+        *[getattr(Question, column) for column in columns])
+
+    if category is not None:
+        query = query.filter(Question.category == category)
+    if difficulty is not None:
+        query = query.filter(Question.difficulty == difficulty)
+
+    query = query.order_by(Question.id).\
+        execution_options(stream_results=True).\
+        yield_per(batch_size)
+
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    if format == 'csv':
+        writer.writerow(columns)
+
+    for count, row in enumerate(query, 1):
+        if format == 'csv':
+            writer.writerow(row)
+        else:
+            buffer.write(json.dumps(dict(zip(columns, row))) + '\n')
+
+        if count % batch_size == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+
+    if buffer.tell():
+        yield buffer.getvalue()
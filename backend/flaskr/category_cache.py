@@ -0,0 +1,56 @@
+import hashlib
+import json
+import threading
+import time
+
+
+class CategoryCache:
+    '''
+    Cached id -> type map of the categories shared by all handlers.
+
+    The map is loaded on first use and kept until invalidate() is
+    called after a category change. With max_age (seconds) it is also
+    reloaded after that long, so changes made by other workers show up.
+    The ETag of the map is computed once per load.
+    '''
+
+    def __init__(self, max_age=None):
+        self.max_age = max_age
+        self._lock = threading.Lock()
+        self._categories = None
+        self._etag = None
+        self._loaded_at = None
+
+    def get(self, loader):
+        '''
+        Returns the category map and its ETag
+
+        Parameters:
+        loader (callable): returns (id, type) rows when the map is stale
+
+        Returns:
+        tuple: ({id: type} dict, etag str)
+        '''
+        with self._lock:
+            if self.is_stale():
+                categories = {category_id: category_type
+                              for category_id, category_type in loader()}
+                self._categories = categories
+                self._etag = hashlib.sha1(json.dumps(
+                    sorted(categories.items())).encode()).hexdigest()
+                self._loaded_at = time.monotonic()
+
+            return self._categories, self._etag
+
+    def invalidate(self):
+        '''Drops the cached map, the next get() reloads it'''
+        with self._lock:
+            self._categories = None
+
+    def is_stale(self):
+        '''Returns True if the next get() reloads the map'''
+        if self._categories is None:
+            return True
+        if self.max_age is None:
+            return False
+        return time.monotonic() - self._loaded_at > self.max_age
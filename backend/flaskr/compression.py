@@ -0,0 +1,92 @@
+import gzip
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# smaller bodies are sent as they are, compressing them saves nothing
+COMPRESS_MIN_SIZE = 500
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+COMPRESSIBLE_MIMETYPES = {
+    'application/json', 'application/x-ndjson', 'text/csv', 'text/plain'}
+# every encoding an ETag may carry as suffix, brotli installed or not
+ENCODINGS = ('br', 'gzip')
+
+
+def etag_variants(etag):
+    '''Returns etag and the ETags of its compressed representations'''
+    return [etag] + ['{}-{}'.format(etag, encoding) for encoding in ENCODINGS]
+
+
+class Compressor:
+    '''
+    Compresses response bodies with brotli, if installed, or gzip.
+
+    Only complete 200 responses of a text mimetype and at least
+    min_size bytes are compressed, streamed responses are left as they
+    are. The encoding is appended to a strong ETag ("<etag>-gzip") as
+    the compressed body is another representation. With a store, the
+    body of a strong ETag is compressed once and then read from the
+    store by ETag and encoding.
+    '''
+
+    def __init__(self, store=None, min_size=COMPRESS_MIN_SIZE):
+        self.store = store
+        self.min_size = min_size
+
+    def encoding(self, accept_encodings):
+        '''Returns the preferred encoding a client accepts, or None'''
+        for encoding in ENCODINGS:
+            if encoding == 'br' and brotli is None:
+                continue
+            if accept_encodings[encoding]:
+                return encoding
+
+        return None
+
+    def compress(self, response, accept_encodings):
+        '''
+        Compresses the body of response in place, if worth it
+
+        Parameters:
+        response (flask.Response): response to send
+        accept_encodings (werkzeug.datastructures.Accept): encodings of
+                                                           the request
+        '''
+        if response.status_code != 200 or response.is_streamed or \
+                response.direct_passthrough or \
+                'Content-Encoding' in response.headers or \
+                response.mimetype not in COMPRESSIBLE_MIMETYPES:
+            return response
+
+        response.vary.add('Accept-Encoding')
+        encoding = self.encoding(accept_encodings)
+        if encoding is None or response.content_length is None or \
+                response.content_length < self.min_size:
+            return response
+
+        etag, weak = response.get_etag()
+        key = (etag, encoding)
+        cacheable = self.store is not None and etag is not None and not weak
+
+        body = self.store.get(key) if cacheable else None
+        if body is None:
+            body = compress(response.get_data(), encoding)
+            if cacheable:
+                self.store.set(key, body)
+
+        response.set_data(body)
+        response.headers['Content-Encoding'] = encoding
+        if etag is not None:
+            response.set_etag('{}-{}'.format(etag, encoding), weak)
+
+        return response
+
+
+def compress(body, encoding):
+    '''Returns body compressed with encoding, 'br' or 'gzip' '''
+    if encoding == 'br':
+        return brotli.compress(body, quality=BROTLI_QUALITY)
+    return gzip.compress(body, compresslevel=GZIP_LEVEL)
@@ -0,0 +1,169 @@
+import mmap
+import os
+import random
+import struct
+import threading
+import time
+from array import array
+
+from .quiz_index import ALL_CATEGORIES
+
+MAGIC = b'TQDK'
+VERSION = 1
+# magic, version, category count, generation (ms since the epoch)
+HEADER = struct.Struct('=4sIIq')
+# category, deck count, deck length, byte offset of the first deck
+ENTRY = struct.Struct('=iIII')
+# ids are Postgres integers
+ITEM = 'i'
+DECKS_PER_CATEGORY = 20
+# seconds between two looks at the file for newer decks
+CHECK_INTERVAL = 1
+
+
+def generate_decks(path, rows, decks=DECKS_PER_CATEGORY, seed=None):
+    '''
+    Writes shuffled decks of the question ids of every category to path
+
+    Every category, and category 0 for all of them, gets decks random
+    permutations of its ids, packed as int32 arrays. The file is written
+    next to path and swapped in with os.replace(), so a running app
+    maps either the old or the new decks.
+
+    Parameters:
+    path (str): decks file
+    rows (iterable): (question_id, category_id) tuples
+    decks (int): decks per category
+    seed (int): seed of the shuffles, random if None
+
+    Returns:
+    dict: {category_id: number of questions}
+    '''
+    rng = random.Random(seed)
+    categories = {ALL_CATEGORIES: array(ITEM)}
+    for question_id, category in rows:
+        categories[ALL_CATEGORIES].append(question_id)
+        if category is not None and category != ALL_CATEGORIES:
+            categories.setdefault(category, array(ITEM)).append(question_id)
+
+    offset = HEADER.size + len(categories) * ENTRY.size
+    entries = []
+    for category, ids in categories.items():
+        entries.append(ENTRY.pack(category, decks, len(ids), offset))
+        offset += decks * len(ids) * ids.itemsize
+
+    temporary = '{}.{}.tmp'.format(path, os.getpid())
+    with open(temporary, 'wb') as file:
+        file.write(HEADER.pack(MAGIC, VERSION, len(categories),
+                               int(time.time() * 1000)))
+        file.write(b''.join(entries))
+        for ids in categories.values():
+            deck = list(ids)
+            for _ in range(decks):
+                rng.shuffle(deck)
+                array(ITEM, deck).tofile(file)
+    os.replace(temporary, path)
+
+    return {category: len(ids) for category, ids in categories.items()}
+
+
+class Decks:
+    '''
+    Read only, memory mapped decks written by generate_decks().
+
+    A quiz walks one deck from position 0, so every step is one array
+    read, whatever the number of questions. The file is looked at
+    again at most every check_interval seconds and mapped anew once
+    replaced; generation tells the decks of two files apart. Decks are
+    as old as the file: questions deleted since then have to be
+    skipped by the caller, new ones are missing until the next run.
+
+    Parameters:
+    path (str): decks file, no decks while it does not exist
+    '''
+
+    def __init__(self, path, check_interval=CHECK_INTERVAL):
+        self.path = path
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._signature = None
+        self._checked_at = None
+        self._generation = None
+        self._categories = {}
+
+    @property
+    def generation(self):
+        '''Returns the generation of the mapped decks, None if none'''
+        self._refresh()
+        return self._generation
+
+    def count(self, category=ALL_CATEGORIES):
+        '''Returns the number of decks of a category'''
+        self._refresh()
+        return len(self._categories.get(category, ()))
+
+    def random_deck(self, category=ALL_CATEGORIES):
+        '''Returns a random deck number of a category, None if none'''
+        count = self.count(category)
+        return random.randrange(count) if count else None
+
+    def length(self, category=ALL_CATEGORIES):
+        '''Returns the number of questions of every deck of a category'''
+        decks = self._categories.get(category, ())
+        return len(decks[0]) if decks else 0
+
+    def question_id(self, category, deck, position):
+        '''
+        Returns the question id at position of a deck, None past its end
+        or for an unknown deck
+        '''
+        decks = self._categories.get(category, ())
+        if not 0 <= deck < len(decks) or \
+                not 0 <= position < len(decks[deck]):
+            return None
+        return decks[deck][position]
+
+    def _refresh(self):
+        '''Maps the decks file again if it was replaced'''
+        now = time.monotonic()
+        if self._checked_at is not None and \
+                now - self._checked_at < self.check_interval:
+            return
+
+        with self._lock:
+            self._checked_at = now
+            try:
+                file = open(self.path, 'rb')
+            except FileNotFoundError:
+                self._signature = None
+                self._generation = None
+                self._categories = {}
+                return
+
+            with file:
+                stat = os.fstat(file.fileno())
+                signature = stat.st_ino, stat.st_mtime_ns, stat.st_size
+                if signature == self._signature:
+                    return
+                view = memoryview(mmap.mmap(
+                    file.fileno(), 0, access=mmap.ACCESS_READ))
+
+            magic, version, category_count, generation = \
+                HEADER.unpack_from(view)
+            if magic != MAGIC or version != VERSION:
+                raise ValueError('{} is not a decks file'.format(self.path))
+
+            itemsize = array(ITEM).itemsize
+            categories = {}
+            for number in range(category_count):
+                category, deck_count, length, offset = ENTRY.unpack_from(
+                    view, HEADER.size + number * ENTRY.size)
+                size = length * itemsize
+                categories[category] = [
+                    view[offset + deck * size:
+                         offset + (deck + 1) * size].cast(ITEM)
+                    for deck in range(deck_count)]
+
+            self._categories = categories
+            self._generation = generation
+            self._signature = signature
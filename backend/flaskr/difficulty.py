@@ -0,0 +1,111 @@
+import math
+
+# questions played by the quiz view, "ramp" reaches the hardest
+# difficulty at the last one
+RAMP_QUESTIONS = 5
+# the weight of a difficulty halves for every step away from the target
+TARGET_FALLOFF = 0.5
+
+
+def draw(index, category, exclude, count, difficulty=None):
+    '''
+    Returns up to count distinct question ids drawn from a QuizIndex
+
+    Parameters:
+    index (QuizIndex): index to draw from
+    category (int): category id, 0 for all categories
+    exclude (list): question ids already played
+    count (int): number of ids wanted
+    difficulty: "difficulty" of the quiz request, see difficulty_weights()
+
+    Returns:
+    list: question ids, fewer than count if not enough are left
+
+    Raises:
+    ValueError: if difficulty is not valid
+    '''
+    difficulties = index.difficulties(category)
+    weights = difficulty_weights(difficulty, difficulties, len(exclude))
+    if weights is None:
+        return index.sample(category, exclude, count)
+
+    # the weights of "ramp" change with every question played
+    question_ids = []
+    while len(question_ids) < count:
+        if question_ids and difficulty == 'ramp':
+            weights = difficulty_weights(
+                difficulty, difficulties,
+                len(exclude) + len(question_ids))
+        question_id = index.pick(category, exclude + question_ids, weights)
+        if question_id is None:
+            break
+        question_ids.append(question_id)
+
+    return question_ids
+
+
+def target_weights(target, difficulties):
+    '''Returns weights favouring the difficulties close to target'''
+    return {difficulty: TARGET_FALLOFF ** abs(difficulty - target)
+            for difficulty in difficulties}
+
+
+def ramp_target(difficulties, played, length=RAMP_QUESTIONS):
+    '''Returns the target difficulty after played questions, rising
+    from the easiest to the hardest over length questions'''
+    progress = min(played / max(length - 1, 1), 1)
+    return difficulties[0] + (difficulties[-1] - difficulties[0]) * progress
+
+
+def difficulty_weights(difficulty, difficulties, played):
+    '''
+    Returns the weights per difficulty of the next quiz question
+
+    Parameters:
+    difficulty: "difficulty" of the quiz request, None for a uniform
+                pick over the questions, "ramp", a target difficulty or
+                a {difficulty: weight} object
+    difficulties (list): sorted difficulties having questions
+    played (int): number of questions already played
+
+    Returns:
+    dict: {difficulty: weight} for QuizIndex.pick(), None if uniform
+
+    Raises:
+    ValueError: if difficulty is not valid
+    '''
+    if difficulty is None:
+        return None
+
+    if difficulty == 'ramp':
+        if not difficulties:
+            return None
+        return target_weights(
+            ramp_target(difficulties, played), difficulties)
+
+    if isinstance(difficulty, dict):
+        weights = {int(key): _finite(weight)
+                   for key, weight in difficulty.items()}
+        if not weights or any(weight < 0 for weight in weights.values()):
+            raise ValueError('invalid difficulty weights')
+        return weights
+
+    if isinstance(difficulty, bool) or \
+            not isinstance(difficulty, (int, float, str)):
+        raise ValueError('invalid difficulty')
+
+    return target_weights(_finite(difficulty), difficulties)
+
+
+def _finite(value):
+    '''
+    Returns value as a finite float, a JSON integer too large for a
+    float raises ValueError like any other invalid number
+    '''
+    try:
+        number = float(value)
+    except OverflowError:
+        raise ValueError('invalid difficulty')
+    if not math.isfinite(number):
+        raise ValueError('invalid difficulty')
+    return number
@@ -0,0 +1,143 @@
+import threading
+import time
+
+from flask import current_app, g, has_app_context
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+
+class RequestTimings:
+    '''Query count and timings of the current request, kept in flask.g'''
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.db_time = 0.0
+        self.serialize_time = 0.0
+
+    def server_timing(self, total_time):
+        '''Returns the Server-Timing header value, durations in ms'''
+        return 'db;dur={:.3f};desc="{} queries", serialize;dur={:.3f}, ' \
+            'total;dur={:.3f}'.format(
+                self.db_time * 1000, self.queries,
+                self.serialize_time * 1000, total_time * 1000)
+
+
+class RouteMetrics:
+    '''
+    Request count, queries and timings summed per route of a worker.
+
+    Every route ("GET /questions") keeps running sums, snapshot()
+    returns the means per request. Like pool_metrics() the numbers are
+    the ones of the worker answering, not of the whole deployment.
+    '''
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._routes = {}
+
+    def record(self, route, timings, total_time):
+        '''Adds the RequestTimings of a finished request of route'''
+        with self._lock:
+            stats = self._routes.setdefault(route, {
+                'requests': 0,
+                'queries': 0,
+                'db_time': 0.0,
+                'serialize_time': 0.0,
+                'total_time': 0.0,
+                'max_total_time': 0.0
+            })
+            stats['requests'] += 1
+            stats['queries'] += timings.queries
+            stats['db_time'] += timings.db_time
+            stats['serialize_time'] += timings.serialize_time
+            stats['total_time'] += total_time
+            stats['max_total_time'] = max(stats['max_total_time'], total_time)
+
+    def snapshot(self):
+        '''
+        Returns the metrics of every route
+
+        Returns:
+        dict: {route: {requests, queries, queries_per_request, db_ms,
+              serialize_ms, total_ms, max_total_ms}}, means per request
+        '''
+        with self._lock:
+            routes = {route: dict(stats)
+                      for route, stats in self._routes.items()}
+
+        return {route: {
+            'requests': stats['requests'],
+            'queries': stats['queries'],
+            'queries_per_request': round(
+                stats['queries'] / stats['requests'], 3),
+            'db_ms': _mean_ms(stats['db_time'], stats['requests']),
+            'serialize_ms': _mean_ms(
+                stats['serialize_time'], stats['requests']),
+            'total_ms': _mean_ms(stats['total_time'], stats['requests']),
+            'max_total_ms': _mean_ms(stats['max_total_time'], 1)
+        } for route, stats in routes.items()}
+
+    def reset(self):
+        with self._lock:
+            self._routes = {}
+
+
+def add_serialize_time(seconds):
+    '''Adds JSON encoding time to the current request, if any'''
+    timings = g.get('request_timings') if has_app_context() else None
+    if timings is not None:
+        timings.serialize_time += seconds
+
+
+def timed_json_encoder(encoder):
+    '''Returns a subclass of encoder adding its time to the request'''
+
+    class TimedJSONEncoder(encoder):
+        def encode(self, o):
+            started = time.perf_counter()
+            try:
+                return super().encode(o)
+            finally:
+                add_serialize_time(time.perf_counter() - started)
+
+    return TimedJSONEncoder
+
+
+def _mean_ms(total_time, count):
+    return round(total_time / count * 1000, 3)
+
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def before_cursor_execute(conn, cursor, statement, parameters, context,
+                          executemany):
+    conn.info.setdefault('query_started', []).append(time.perf_counter())
+
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def after_cursor_execute(conn, cursor, statement, parameters, context,
+                         executemany):
+    elapsed = time.perf_counter() - conn.info['query_started'].pop()
+
+    if not has_app_context():
+        return
+
+    timings = g.get('request_timings')
+    if timings is not None:
+        timings.queries += 1
+        timings.db_time += elapsed
+
+    threshold = current_app.config.get('SLOW_QUERY_MS')
+    if threshold is not None and elapsed * 1000 >= threshold:
+        current_app.logger.warning(
+            'slow query (%.1f ms): %s parameters: %r',
+            elapsed * 1000, statement, parameters)
+
+
+@event.listens_for(Engine, 'handle_error')
+def handle_error(context):
+    # a failed statement never reaches after_cursor_execute
+    started = context.connection.info.get('query_started') \
+        if context.connection is not None else None
+    if started:
+        started.pop()
@@ -0,0 +1,299 @@
+import bisect
+import random
+import threading
+import time
+
+# the "All" entry of the quiz view is sent as category 0
+ALL_CATEGORIES = 0
+
+
+class QuizIndex:
+    '''
+    In-process index of question ids grouped by category.
+
+    Keeps a sorted list of ids per category, and per category and
+    difficulty, so a quiz question can be picked at random without
+    loading the questions table. The index is filled from (id,
+    category, difficulty) rows by load() and kept up to date with add()
+    and remove(). When max_age (seconds) is set the index reports
+    itself stale after that long, so workers pick up changes made by
+    other processes.
+    '''
+
+    def __init__(self, max_age=None):
+        self.max_age = max_age
+        self._lock = threading.RLock()
+        self._ids = None
+        self._buckets = {}
+        self._categories = {}
+        self._difficulties = {}
+        self._loaded_at = None
+
+    def is_stale(self):
+        '''Returns True if the index has to be (re)loaded'''
+        if self._loaded_at is None:
+            return True
+        if self.max_age is None:
+            return False
+        return time.monotonic() - self._loaded_at > self.max_age
+
+    def invalidate(self):
+        '''Marks the index stale, the next use reloads it'''
+        with self._lock:
+            self._loaded_at = None
+
+    def load(self, rows):
+        '''
+        Replaces the index content
+
+        Parameters:
+        rows (iterable): (question_id, category_id, difficulty) tuples
+        '''
+        ids = {ALL_CATEGORIES: []}
+        buckets = {}
+        categories = {}
+        difficulties = {}
+
+        for question_id, category, difficulty in rows:
+            question_id, category, difficulty = \
+                int(question_id), _category(category), _category(difficulty)
+            categories[question_id] = category
+            difficulties[question_id] = difficulty
+            for key in _keys(category):
+                ids.setdefault(key, []).append(question_id)
+                buckets.setdefault((key, difficulty), []).append(question_id)
+
+        for bucket in list(ids.values()) + list(buckets.values()):
+            bucket.sort()
+
+        with self._lock:
+            self._ids = ids
+            self._buckets = buckets
+            self._categories = categories
+            self._difficulties = difficulties
+            self._loaded_at = time.monotonic()
+
+    def add(self, question_id, category, difficulty=None):
+        '''Adds a question id to the index'''
+        question_id, category, difficulty = \
+            int(question_id), _category(category), _category(difficulty)
+
+        with self._lock:
+            if self._ids is None:
+                return
+            if question_id in self._categories:
+                self.remove(question_id)
+            self._categories[question_id] = category
+            self._difficulties[question_id] = difficulty
+            for key in _keys(category):
+                bisect.insort(self._ids.setdefault(key, []), question_id)
+                bisect.insort(self._buckets.setdefault(
+                    (key, difficulty), []), question_id)
+
+    def remove(self, question_id):
+        '''Removes a question id from the index, if present'''
+        question_id = int(question_id)
+
+        with self._lock:
+            if self._ids is None:
+                return
+            if question_id not in self._categories:
+                return
+            category = self._categories.pop(question_id)
+            difficulty = self._difficulties.pop(question_id)
+            for key in _keys(category):
+                for bucket in (self._ids[key],
+                               self._buckets[(key, difficulty)]):
+                    position = bisect.bisect_left(bucket, question_id)
+                    if position < len(bucket) and \
+                            bucket[position] == question_id:
+                        del bucket[position]
+
+    def category_of(self, question_id):
+        '''Returns the indexed category of a question, None if unknown'''
+        with self._lock:
+            return self._categories.get(int(question_id))
+
+    def count(self, category=ALL_CATEGORIES):
+        '''Returns the number of indexed questions in a category'''
+        with self._lock:
+            return len(self._ids.get(category, ()))
+
+    def stats(self):
+        '''
+        Returns the number of indexed questions per category and
+        difficulty, without the questions having no difficulty
+
+        Runs in O(categories * difficulties), whatever the number of
+        questions.
+
+        Returns:
+        dict: {category_id: {difficulty: count}}, category 0 counts the
+              questions of all categories
+        '''
+        with self._lock:
+            stats = {}
+            for (key, difficulty), bucket in self._buckets.items():
+                if bucket and difficulty is not None:
+                    stats.setdefault(key, {})[difficulty] = len(bucket)
+
+            return stats
+
+    def id_at(self, category, position):
+        '''
+        Returns the question id at position of the sorted ids of a
+        category, None past the end
+        '''
+        with self._lock:
+            bucket = self._ids.get(category, ())
+            return bucket[position] if position < len(bucket) else None
+
+    def ids(self, category=ALL_CATEGORIES):
+        '''Returns a copy of the sorted question ids of a category'''
+        with self._lock:
+            return list(self._ids.get(category, ()))
+
+    def difficulties(self, category=ALL_CATEGORIES):
+        '''Returns the sorted difficulties having questions in a category'''
+        with self._lock:
+            return sorted(difficulty
+                          for (key, difficulty), bucket
+                          in self._buckets.items()
+                          if key == category and bucket and
+                          difficulty is not None)
+
+    def sample(self, category=ALL_CATEGORIES, exclude=(), count=1):
+        '''
+        Returns up to count distinct random question ids of a category
+        that are not in exclude
+
+        Draws without replacement, every eligible id has the same
+        probability and the ids are returned in the order drawn. Runs
+        in O(len(exclude) * log n + count * log count).
+
+        Parameters:
+        category (int): category id, 0 for all categories
+        exclude (iterable): question ids that must not be returned
+        count (int): number of ids wanted
+
+        Returns:
+        list: question ids, fewer than count if not enough are left
+        '''
+        with self._lock:
+            bucket = self._ids.get(category, ())
+            excluded = _positions(bucket, exclude)
+            available = len(bucket) - len(excluded)
+
+            ranks = random.sample(range(max(available, 0)),
+                                  min(count, max(available, 0)))
+            positions = dict(zip(sorted(ranks),
+                                 _skip_sorted(sorted(ranks), excluded)))
+
+            return [bucket[positions[rank]] for rank in ranks]
+
+    def pick(self, category=ALL_CATEGORIES, exclude=(), weights=None):
+        '''
+        Returns a random question id of a category that is not in exclude
+
+        Without weights every eligible id has the same probability.
+        With weights a difficulty is drawn first, with a probability
+        proportional to its weight among the difficulties having
+        eligible questions left, then an id of that difficulty. Runs in
+        O(len(exclude) * log n + number of difficulties) and never
+        builds the candidate list.
+
+        Parameters:
+        category (int): category id, 0 for all categories
+        exclude (iterable): question ids that must not be returned
+        weights (dict): {difficulty: weight}, see flaskr.difficulty
+
+        Returns:
+        int: question id or None if no question is left
+        '''
+        with self._lock:
+            if weights is None:
+                bucket = self._ids.get(category, ())
+                return _pick(bucket, _positions(bucket, exclude))
+
+            excluded_ids = {}
+            for question_id in exclude:
+                excluded_ids.setdefault(
+                    self._difficulties.get(question_id), []).\
+                    append(question_id)
+
+            candidates = []
+            total = 0
+            for difficulty, weight in weights.items():
+                bucket = self._buckets.get((category, difficulty), ())
+                excluded = _positions(
+                    bucket, excluded_ids.get(difficulty, ()))
+                if weight > 0 and len(bucket) > len(excluded):
+                    total += weight
+                    candidates.append((total, bucket, excluded))
+
+            if not candidates:
+                return None
+
+            draw = random.random() * total
+            for threshold, bucket, excluded in candidates:
+                if draw < threshold:
+                    break
+
+            return _pick(bucket, excluded)
+
+
+def _category(category):
+    '''Returns the category as int, questions may have no category'''
+    return None if category is None else int(category)
+
+
+def _keys(category):
+    '''Returns the buckets a question of a category belongs to'''
+    if category is None or category == ALL_CATEGORIES:
+        return (ALL_CATEGORIES,)
+    return (ALL_CATEGORIES, category)
+
+
+def _pick(bucket, excluded):
+    '''Returns a random id of bucket not at the excluded positions'''
+    available = len(bucket) - len(excluded)
+
+    if available <= 0:
+        return None
+
+    return bucket[_skip(random.randrange(available), excluded)]
+
+
+def _positions(bucket, question_ids):
+    '''Returns the sorted positions of the question_ids found in bucket'''
+    positions = set()
+
+    for question_id in question_ids:
+        position = bisect.bisect_left(bucket, question_id)
+        if position < len(bucket) and bucket[position] == question_id:
+            positions.add(position)
+
+    return sorted(positions)
+
+
+def _skip_sorted(ranks, excluded):
+    '''_skip() of every sorted rank in one pass over excluded'''
+    positions = []
+    skipped = 0
+
+    for rank in ranks:
+        while skipped < len(excluded) and excluded[skipped] <= rank + skipped:
+            skipped += 1
+        positions.append(rank + skipped)
+
+    return positions
+
+
+def _skip(rank, excluded):
+    '''Maps the rank among non excluded positions to a bucket position'''
+    for position in excluded:
+        if position > rank:
+            break
+        rank += 1
+
+    return rank
@@ -0,0 +1,112 @@
+import hashlib
+import random
+import secrets
+
+# rounds of the Feistel network shuffling the positions of a session
+ROUNDS = 4
+# question ids a session remembers to skip after the index changed
+SEEN_LIMIT = 256
+
+
+class QuizSession:
+    '''
+    Server side state of a quiz being played.
+
+    Holds no question ids: a session walks the positions of the quiz
+    index ids of its category in an order given by a seed (see
+    shuffled_position()), so every next_id() call is O(1) and the
+    session stays small in a shared store, whatever the size of the
+    category. The client does not have to send the questions played
+    so far.
+
+    A session created from_deck() walks a deck of flaskr.decks.Decks
+    instead. Positions are never played twice, so nothing repeats while
+    the index and decks stay the same. In case questions are added or
+    deleted, or the decks replaced (see leave_deck()), a session also
+    skips the last SEEN_LIMIT ids it played. Positions past the end of
+    a shrunk category are skipped.
+    '''
+
+    def __init__(self, category, total, seed=None):
+        self.id = secrets.token_urlsafe(16)
+        self.category = category
+        self.total = total
+        self.seed = random.getrandbits(64) if seed is None else seed
+        self.played = 0
+        self.deck = None
+        self._position = 0
+        self._seen = set()
+
+    @classmethod
+    def from_deck(cls, category, generation, deck, length):
+        '''
+        Returns a session playing a precomputed deck
+
+        Parameters:
+        category (int): category id, 0 for all categories
+        generation (int): Decks.generation of the deck
+        deck (int): deck number
+        length (int): number of questions of the deck
+        '''
+        session = cls(category, length)
+        session.deck = (generation, deck)
+        return session
+
+    def next_id(self, quiz_index, decks=None):
+        '''Returns the next random question id, None once all were played'''
+        while self._position < self.total:
+            if self.deck is not None:
+                question_id = decks.question_id(
+                    self.category, self.deck[1], self._position)
+            else:
+                question_id = quiz_index.id_at(
+                    self.category,
+                    shuffled_position(self._position, self.total, self.seed))
+            self._position += 1
+
+            if question_id is not None and question_id not in self._seen:
+                if len(self._seen) >= SEEN_LIMIT:
+                    self._seen.pop()
+                self._seen.add(question_id)
+                self.played += 1
+                return question_id
+
+        return None
+
+    def leave_deck(self, total):
+        '''
+        Goes on with the total quiz index ids of the category not played
+        yet, for a session whose deck is gone
+        '''
+        self.deck = None
+        self.total = total
+        self._position = 0
+
+
+def shuffled_position(position, size, seed):
+    '''
+    Returns the position at position of a random permutation of
+    range(size) given by seed
+
+    A Feistel network over the smallest even power of two holding size
+    is a permutation of that range, positions falling out of range(size)
+    are walked through it again until they fall in, at most four times
+    on average. Every worker gets the same permutation of a seed.
+    '''
+    half = max((size - 1).bit_length() + 1, 2) // 2
+    mask = (1 << half) - 1
+
+    while True:
+        left, right = position >> half, position & mask
+        for number in range(ROUNDS):
+            left, right = right, left ^ (_round(seed, number, right) & mask)
+        position = (left << half) | right
+        if position < size:
+            return position
+
+
+def _round(seed, number, value):
+    '''Round function of shuffled_position(), the same in every process'''
+    digest = hashlib.blake2b(
+        '{}:{}:{}'.format(seed, number, value).encode(), digest_size=8)
+    return int.from_bytes(digest.digest(), 'big')
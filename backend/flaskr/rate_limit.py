@@ -0,0 +1,115 @@
+import threading
+import time
+from collections import Counter
+
+
+class RateLimiter:
+    '''
+    Token bucket per route and client.
+
+    A bucket holds up to burst tokens and refills at rate tokens per
+    second, every request takes one. The buckets live in a store with
+    an atomic update(): a MemoryStore limits per worker, a SqliteStore
+    per host. A bucket left alone until it is full again expires, a
+    missing bucket is a full one.
+
+    Parameters:
+    store: buckets store, see flaskr.stores
+    limits (dict): {route: (rate, burst)}, other routes are not limited
+    client_limits (dict): {client: {route: (rate, burst) or None}}
+        overriding limits for some clients, None means unlimited
+    '''
+
+    def __init__(self, store, limits, client_limits=None):
+        self.store = store
+        self.limits = limits
+        self.client_limits = client_limits or {}
+
+    def limit(self, route, client):
+        '''Returns the (rate, burst) of a client on a route, None if none'''
+        client_limits = self.client_limits.get(client, {})
+        if route in client_limits:
+            return client_limits[route]
+        return self.limits.get(route)
+
+    def take(self, route, client):
+        '''
+        Takes a token of the bucket of client on route
+
+        Returns:
+        float: 0 if the request may run, else the seconds until the
+            bucket has a token again
+        '''
+        limit = self.limit(route, client)
+        if limit is None:
+            return 0
+
+        rate, burst = limit
+        now = time.time()
+
+        def take_token(bucket):
+            tokens, updated_at, _ = bucket or (burst, now, True)
+            tokens = min(burst, tokens + max(now - updated_at, 0) * rate)
+            if tokens >= 1:
+                return tokens - 1, now, True
+            return tokens, now, False
+
+        tokens, _, taken = self.store.update(
+            'rate:{}:{}'.format(route, client), take_token,
+            ttl=burst / rate)
+
+        return 0 if taken else (1 - tokens) / rate
+
+
+class ConcurrencyGate:
+    '''
+    Requests running at once per route and per client in a worker.
+
+    enter() admits a request or refuses it right away, it never waits
+    for a slot: an overloaded worker answers at once instead of
+    queueing requests until they time out.
+
+    Parameters:
+    limits (dict): {route: requests at once}, other routes are not
+        limited per route
+    client_limit (int): requests at once of a client over all the
+        gated routes, None for no limit. A request of client None only
+        counts per route
+    '''
+
+    def __init__(self, limits, client_limit=None):
+        self.limits = limits
+        self.client_limit = client_limit
+        self._lock = threading.Lock()
+        self._routes = Counter()
+        self._clients = Counter()
+
+    def enter(self, route, client):
+        '''Returns True and counts the request in if there is room'''
+        with self._lock:
+            limit = self.limits.get(route)
+            if limit is not None and self._routes[route] >= limit:
+                return False
+            if client is not None and self.client_limit is not None and \
+                    self._clients[client] >= self.client_limit:
+                return False
+
+            self._routes[route] += 1
+            if client is not None:
+                self._clients[client] += 1
+            return True
+
+    def leave(self, route, client):
+        '''Counts out a request admitted by enter()'''
+        with self._lock:
+            self._routes[route] -= 1
+            if client is not None:
+                self._clients[client] -= 1
+                if not self._clients[client]:
+                    del self._clients[client]
+
+    def in_flight(self):
+        '''Returns {route: requests running} of the gated routes'''
+        with self._lock:
+            return {route: count
+                    for route, count in self._routes.items() if count}
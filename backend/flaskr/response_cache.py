@@ -0,0 +1,71 @@
+import hashlib
+import secrets
+import time
+
+from .stores import MemoryStore
+
+
+class ResponseCache:
+    '''
+    Cache of response bodies of the read endpoints.
+
+    Every entry depends on tags such as 'questions', 'category:3' or
+    'categories'. The current version of each tag is part of the entry
+    key, so invalidate() only bumps the versions of the changed tags:
+    entries of other tags stay valid and outdated entries are never
+    read again (they age out of the store).
+
+    Parameters:
+    store: entries store, see flaskr.stores
+    versions: store of the tag versions shared by the workers, it must
+        not evict keys; versions of this worker only if None
+    ttl (int): seconds an entry is kept
+    '''
+
+    def __init__(self, store, versions=None, ttl=None):
+        self.store = store
+        self.shared = versions is not None
+        self.versions = versions if self.shared else MemoryStore()
+        self.ttl = ttl
+        # versions of one worker do not count the writes of the others
+        self._scope = '' if self.shared else secrets.token_hex(4)
+
+    def key(self, path, args, tags):
+        '''Returns the entry key of a request path and its query args'''
+        versions = ','.join('{}={}'.format(tag, self.versions.get(
+            'version:' + tag, 0)) for tag in sorted(tags))
+        return 'response:{}?{}#{}'.format(
+            path, '&'.join('{}={}'.format(name, value)
+                           for name, value in sorted(args.items(multi=True))),
+            versions)
+
+    def etag(self, key):
+        '''
+        Returns the strong ETag of the entry of key
+
+        Derived from the key only, so from the path, the arguments and
+        the tag versions, and known before the body is rendered or
+        found in the cache. The body is never hashed. With shared
+        versions it is the same in every worker and until a write.
+        Versions of this worker miss the writes of the others, so the
+        ETag is then also scoped to the worker and to the current TTL
+        period, like the entries themselves.
+        '''
+        scope = self._scope
+        if not self.shared and self.ttl:
+            scope += ':{}'.format(int(time.time() // self.ttl))
+        return hashlib.sha1(
+            (scope + key).encode('utf-8')).hexdigest()[:16]
+
+    def get(self, key):
+        '''Returns the cached (body, etag) of key or None'''
+        return self.store.get(key)
+
+    def set(self, key, body, etag):
+        '''Caches the body and etag of a response'''
+        self.store.set(key, (body, etag), ttl=self.ttl)
+
+    def invalidate(self, *tags):
+        '''Makes the entries depending on any of tags outdated'''
+        for tag in tags:
+            self.versions.incr('version:' + tag)
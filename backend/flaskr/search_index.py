@@ -0,0 +1,182 @@
+import bisect
+import heapq
+import re
+import threading
+import time
+
+TOKEN_PATTERN = re.compile(r'\w+')
+# a term found in the question counts more than one found in the answer
+QUESTION_WEIGHT = 2
+ANSWER_WEIGHT = 1
+# words starting with a prefix looked at by complete(), short prefixes
+# are ranked among the first ones only
+COMPLETE_SCAN = 1000
+
+
+def tokenize(text):
+    '''Returns the lower case words of text'''
+    return TOKEN_PATTERN.findall((text or '').lower())
+
+
+class SearchIndex:
+    '''
+    In-process inverted index over question and answer text.
+
+    Maps every word to the questions containing it, with a weight that
+    favours matches in the question over matches in the answer. The
+    words are also kept sorted so a search term matches every word it
+    is a prefix of ("movi" finds "movie"). Like QuizIndex it is filled
+    by load(), kept current with add()/remove() and reports itself
+    stale after max_age seconds.
+    '''
+
+    def __init__(self, max_age=None):
+        self.max_age = max_age
+        self._lock = threading.RLock()
+        self._postings = None
+        self._tokens = []
+        self._documents = {}
+        self._loaded_at = None
+
+    def is_stale(self):
+        '''Returns True if the index has to be (re)loaded'''
+        if self._loaded_at is None:
+            return True
+        if self.max_age is None:
+            return False
+        return time.monotonic() - self._loaded_at > self.max_age
+
+    def invalidate(self):
+        '''Marks the index stale, the next use reloads it'''
+        with self._lock:
+            self._loaded_at = None
+
+    def load(self, rows):
+        '''
+        Replaces the index content
+
+        Parameters:
+        rows (iterable): (question_id, question, answer) tuples
+        '''
+        with self._lock:
+            self._postings = {}
+            self._tokens = []
+            self._documents = {}
+
+            for question_id, question, answer in rows:
+                self._index(int(question_id), question, answer)
+
+            self._tokens = sorted(self._postings)
+            self._loaded_at = time.monotonic()
+
+    def add(self, question_id, question, answer):
+        '''Adds or replaces a question in the index'''
+        question_id = int(question_id)
+
+        with self._lock:
+            if self._postings is None:
+                return
+            self.remove(question_id)
+            for token in self._index(question_id, question, answer):
+                position = bisect.bisect_left(self._tokens, token)
+                if position == len(self._tokens) or \
+                        self._tokens[position] != token:
+                    self._tokens.insert(position, token)
+
+    def remove(self, question_id):
+        '''Removes a question from the index, if present'''
+        question_id = int(question_id)
+
+        with self._lock:
+            if self._postings is None:
+                return
+            for token in self._documents.pop(question_id, ()):
+                postings = self._postings[token]
+                postings.pop(question_id, None)
+                if not postings:
+                    del self._postings[token]
+                    del self._tokens[
+                        bisect.bisect_left(self._tokens, token)]
+
+    def search(self, term):
+        '''
+        Returns the ids of the questions matching every word of term,
+        the most relevant first
+
+        Parameters:
+        term (str): search term, each word matches as a prefix
+
+        Returns:
+        list: question ids ordered by relevance, then id
+        '''
+        words = tokenize(term)
+        if not words:
+            return []
+
+        with self._lock:
+            scores = None
+            for word in words:
+                word_scores = self._match(word)
+                if scores is None:
+                    scores = word_scores
+                else:
+                    scores = {question_id: score + word_scores[question_id]
+                              for question_id, score in scores.items()
+                              if question_id in word_scores}
+                if not scores:
+                    return []
+
+        return sorted(scores, key=lambda question_id: (
+            -scores[question_id], question_id))
+
+    def complete(self, prefix, limit):
+        '''
+        Returns the indexed words starting with prefix, the words found
+        in the most questions first
+
+        Parameters:
+        prefix (str): lower case start of a word
+        limit (int): maximum number of words
+
+        Returns:
+        list: at most limit words
+        '''
+        with self._lock:
+            position = bisect.bisect_left(self._tokens, prefix)
+            end = min(position + COMPLETE_SCAN, len(self._tokens))
+            words = []
+            while position < end and \
+                    self._tokens[position].startswith(prefix):
+                words.append(self._tokens[position])
+                position += 1
+
+            return heapq.nsmallest(limit, words, key=lambda word: (
+                -len(self._postings[word]), word))
+
+    def _match(self, word):
+        '''Returns {question_id: score} for the words starting with word'''
+        scores = {}
+        position = bisect.bisect_left(self._tokens, word)
+
+        while position < len(self._tokens) and \
+                self._tokens[position].startswith(word):
+            for question_id, weight in \
+                    self._postings[self._tokens[position]].items():
+                scores[question_id] = scores.get(question_id, 0) + weight
+            position += 1
+
+        return scores
+
+    def _index(self, question_id, question, answer):
+        '''Adds the postings of a question, returns its words'''
+        weights = {}
+        for token in tokenize(question):
+            weights[token] = weights.get(token, 0) + QUESTION_WEIGHT
+        for token in tokenize(answer):
+            weights[token] = weights.get(token, 0) + ANSWER_WEIGHT
+
+        for token, weight in weights.items():
+            self._postings.setdefault(token, {})[question_id] = weight
+        self._documents[question_id] = tuple(weights)
+
+        return weights
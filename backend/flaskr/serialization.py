@@ -0,0 +1,132 @@
+import json
+
+from models import Question
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# the columns of Question.format(), selected as plain tuples
+QUESTION_COLUMNS = (Question.id, Question.question, Question.answer,
+                    Question.category, Question.difficulty)
+
+
+class Fragment(bytes):
+    '''Already encoded JSON value, embedded as is by encode()'''
+
+
+def stdlib_dumps(obj):
+    '''Encodes obj like jsonify, with sorted keys and no whitespace'''
+    return json.dumps(obj, sort_keys=True, separators=(',', ':')).\
+        encode('utf-8')
+
+
+def orjson_dumps(obj):
+    '''Encodes obj with orjson, with sorted keys like jsonify'''
+    return orjson.dumps(
+        obj, option=orjson.OPT_SORT_KEYS | orjson.OPT_NON_STR_KEYS)
+
+
+def default_dumps():
+    '''Returns orjson_dumps if orjson is installed, else stdlib_dumps'''
+    return orjson_dumps if orjson is not None else stdlib_dumps
+
+
+def encode(obj, dumps=stdlib_dumps):
+    '''
+    Encodes obj with dumps, embedding its Fragment values as they are
+
+    Parameters:
+    obj: JSON value, dict and list values may be Fragment instances
+    dumps (callable): encodes a JSON value to bytes
+
+    Returns:
+    bytes: JSON document
+    '''
+    if isinstance(obj, Fragment):
+        return obj
+    if isinstance(obj, dict) and any(map(_has_fragment, obj.values())):
+        return b'{' + b','.join(
+            dumps(str(key)) + b':' + encode(value, dumps)
+            for key, value in sorted(obj.items())) + b'}'
+    if isinstance(obj, (list, tuple)) and any(map(_has_fragment, obj)):
+        return b'[' + b','.join(encode(value, dumps) for value in obj) + b']'
+    return dumps(obj)
+
+
+def question_json(row):
+    '''Returns the Question.format() dict of a QUESTION_COLUMNS row'''
+    question_id, question, answer, category, difficulty = row
+    return {
+        'id': question_id,
+        'question': question,
+        'answer': answer,
+        'category': category,
+        'difficulty': difficulty
+    }
+
+
+class QuestionFragments:
+    '''
+    Encoded JSON of questions by id.
+
+    List endpoints encode the QUESTION_COLUMNS rows they selected once
+    and keep the result, endpoints answering with known ids (quiz,
+    search) then skip the query for the questions already encoded.
+    Entries are dropped by invalidate() after a change and expire with
+    the TTL of the store, see flaskr.stores.MemoryStore.
+    '''
+
+    def __init__(self, store, dumps=stdlib_dumps):
+        self.store = store
+        self.dumps = dumps
+
+    def encode_rows(self, rows):
+        '''Returns the Fragment of every QUESTION_COLUMNS row'''
+        fragments = []
+        for row in rows:
+            fragment = Fragment(self.dumps(question_json(row)))
+            self.store.set(row[0], fragment)
+            fragments.append(fragment)
+
+        return fragments
+
+    def get_many(self, question_ids, loader):
+        '''
+        Returns the Fragment of the question_ids found
+
+        Parameters:
+        question_ids (list): question ids
+        loader (callable): returns the QUESTION_COLUMNS rows of the
+                           ids given, for the ids not encoded yet
+
+        Returns:
+        dict: {question_id: Fragment}, without the ids not found
+        '''
+        fragments = {}
+        missing = []
+
+        for question_id in question_ids:
+            fragment = self.store.get(question_id)
+            if fragment is None:
+                missing.append(question_id)
+            else:
+                fragments[question_id] = fragment
+
+        if missing:
+            rows = loader(missing)
+            fragments.update(zip(
+                [row[0] for row in rows], self.encode_rows(rows)))
+
+        return fragments
+
+    def invalidate(self, question_id):
+        self.store.delete(question_id)
+
+
+def _has_fragment(value):
+    if isinstance(value, Fragment):
+        return True
+    return isinstance(value, (list, tuple)) and \
+        any(isinstance(item, Fragment) for item in value)
@@ -0,0 +1,282 @@
+import bisect
+import mmap
+import os
+import struct
+import threading
+import time
+from array import array
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+from .quiz_index import QuizIndex
+
+MAGIC = b'TQIX'
+VERSION = 1
+# magic, version, bucket count, question count, build start (time.time())
+HEADER = struct.Struct('=4sIIId')
+# category key, difficulty, byte offset, length of a bucket
+ENTRY = struct.Struct('=iiII')
+# difficulty of the bucket of every question of a category, and the
+# value stored for a missing category or difficulty
+ANY_DIFFICULTY = -2
+NONE = -1
+# ids are Postgres integers
+ITEM = 'i'
+# seconds between two looks at the file for a newer index
+CHECK_INTERVAL = 1
+# seconds a write waits for others before the rebuild starts
+REBUILD_DELAY = 1
+
+
+class SharedQuizIndex(QuizIndex):
+    '''
+    QuizIndex read from a memory mapped file shared by the workers of a
+    host.
+
+    The sorted question ids of every category, and of every category
+    and difficulty, are packed as int32 arrays in one file. Every
+    worker maps it read only, so the pages are in memory once whatever
+    the number of workers, and picks ids straight from the mapping
+    with the QuizIndex methods.
+
+    The file is never changed in place: load() writes a new one next to
+    it and swaps it in with os.replace(), under a lock file so only one
+    worker rebuilds at a time. Workers notice the new file within
+    check_interval seconds and map it, readers of the old mapping keep
+    it until they are done. add() and remove() cannot change the
+    mapping, they start a rebuild from rows() in a background thread
+    after rebuild_delay seconds, so a burst of writes costs one
+    rebuild. Until then other workers may pick a deleted question,
+    get_quiz already skips those.
+
+    Parameters:
+    path (str): index file, created by the first load()
+    rows (callable): returns the (id, category, difficulty) rows of a
+        background rebuild, in an app context of its own
+    max_age (int): seconds after which the file is rebuilt
+    '''
+
+    def __init__(self, path, rows=None, max_age=None,
+                 check_interval=CHECK_INTERVAL, rebuild_delay=REBUILD_DELAY):
+        if fcntl is None:
+            raise RuntimeError('a shared quiz index needs fcntl (Unix)')
+        super().__init__(max_age=max_age)
+        self.path = path
+        self.rows = rows
+        self.check_interval = check_interval
+        self.rebuild_delay = rebuild_delay
+        self._signature = None
+        self._checked_at = None
+        self._built_at = None
+        self._invalidated = False
+        self._timer = None
+
+    def is_stale(self):
+        '''Returns True if the index file has to be (re)built'''
+        self._refresh()
+        if self._invalidated or self._ids is None:
+            return True
+        if self.max_age is None:
+            return False
+        return time.time() - self._built_at > self.max_age
+
+    def invalidate(self):
+        '''Marks the index stale, the next use rebuilds the file'''
+        with self._lock:
+            self._invalidated = True
+
+    def load(self, rows):
+        '''
+        Writes the index file of rows and maps it
+
+        A worker waiting for the lock while another one rebuilt maps
+        the new file instead, rows are then never read.
+
+        Parameters:
+        rows (iterable): (question_id, category_id, difficulty) tuples
+        '''
+        requested_at = time.time()
+
+        with open(self.path + '.lock', 'a') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                built_at = _built_at(self.path)
+                if built_at is None or built_at < requested_at:
+                    _write(self.path, rows)
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+        with self._lock:
+            self._invalidated = False
+            self._attach()
+
+    def add(self, question_id, category, difficulty=None):
+        '''Rebuilds the file soon, the mapping itself is read only'''
+        self._schedule_rebuild()
+
+    def remove(self, question_id):
+        '''Rebuilds the file soon, the mapping itself is read only'''
+        self._schedule_rebuild()
+
+    def _schedule_rebuild(self):
+        with self._lock:
+            if self._timer is not None or self.rows is None:
+                return
+            self._timer = threading.Timer(self.rebuild_delay, self._rebuild)
+            self._timer.daemon = True
+            self._timer.start()
+
+    def _rebuild(self):
+        with self._lock:
+            # a write from now on needs a rebuild of its own
+            self._timer = None
+        try:
+            self.load(self.rows())
+        except Exception:
+            # nothing to report to in a timer thread, the next request
+            # rebuilds and raises
+            self.invalidate()
+
+    def _refresh(self):
+        '''Maps the index file again if another worker replaced it'''
+        now = time.monotonic()
+        if self._checked_at is not None and \
+                now - self._checked_at < self.check_interval:
+            return
+
+        with self._lock:
+            self._checked_at = now
+            if _signature(self.path) != self._signature:
+                self._attach()
+
+    def _attach(self):
+        '''Maps the current index file, called with the lock held'''
+        self._checked_at = time.monotonic()
+        try:
+            with open(self.path, 'rb') as file:
+                signature = _signature_of(os.fstat(file.fileno()))
+                mapping = mmap.mmap(
+                    file.fileno(), 0, access=mmap.ACCESS_READ)
+        except FileNotFoundError:
+            self._ids = None
+            self._signature = None
+            return
+
+        view = memoryview(mapping)
+        magic, version, bucket_count, question_count, built_at = \
+            HEADER.unpack_from(view)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError('{} is not a quiz index file'.format(self.path))
+
+        ids = {}
+        buckets = {}
+        for number in range(bucket_count):
+            key, difficulty, offset, length = ENTRY.unpack_from(
+                view, HEADER.size + number * ENTRY.size)
+            bucket = _array(view, offset, length)
+            if difficulty == ANY_DIFFICULTY:
+                ids[key] = bucket
+            else:
+                buckets[(key, _loaded(difficulty))] = bucket
+
+        # the questions, their categories and difficulties come first
+        offset = HEADER.size + bucket_count * ENTRY.size
+        size = question_count * array(ITEM).itemsize
+        questions = _array(view, offset, question_count)
+
+        self._ids = ids
+        self._buckets = buckets
+        self._categories = _Column(questions, _array(
+            view, offset + size, question_count))
+        self._difficulties = _Column(questions, _array(
+            view, offset + 2 * size, question_count))
+        self._built_at = built_at
+        self._signature = signature
+
+
+class _Column:
+    '''Read only {question id: value} view of two parallel arrays'''
+
+    def __init__(self, questions, values):
+        self._questions = questions
+        self._values = values
+
+    def get(self, question_id, default=None):
+        position = bisect.bisect_left(self._questions, question_id)
+        if position == len(self._questions) or \
+                self._questions[position] != question_id:
+            return default
+        return _loaded(self._values[position])
+
+
+def _write(path, rows):
+    '''Writes the index file of rows next to path and swaps it in'''
+    built_at = time.time()
+    index = QuizIndex()
+    index.load(rows)
+
+    questions = sorted(index._categories)
+    columns = [
+        array(ITEM, questions),
+        array(ITEM, (_stored(index._categories[question_id])
+                     for question_id in questions)),
+        array(ITEM, (_stored(index._difficulties[question_id])
+                     for question_id in questions))
+    ]
+    buckets = [((key, ANY_DIFFICULTY), array(ITEM, bucket))
+               for key, bucket in index._ids.items()] + \
+        [((key, _stored(difficulty)), array(ITEM, bucket))
+         for (key, difficulty), bucket in index._buckets.items() if bucket]
+
+    offset = HEADER.size + len(buckets) * ENTRY.size + \
+        sum(len(column) * column.itemsize for column in columns)
+    entries = []
+    for (key, difficulty), bucket in buckets:
+        entries.append(ENTRY.pack(key, difficulty, offset, len(bucket)))
+        offset += len(bucket) * bucket.itemsize
+
+    temporary = '{}.{}.tmp'.format(path, os.getpid())
+    with open(temporary, 'wb') as file:
+        file.write(HEADER.pack(
+            MAGIC, VERSION, len(buckets), len(questions), built_at))
+        file.write(b''.join(entries))
+        for packed in columns + [bucket for _, bucket in buckets]:
+            packed.tofile(file)
+    os.replace(temporary, path)
+
+
+def _built_at(path):
+    '''Returns the build start of the index file at path, None if none'''
+    try:
+        with open(path, 'rb') as file:
+            return HEADER.unpack(file.read(HEADER.size))[4]
+    except (FileNotFoundError, struct.error):
+        return None
+
+
+def _array(view, offset, length):
+    '''Returns length ids of view at byte offset, without a copy'''
+    return view[offset:offset + length * array(ITEM).itemsize].cast(ITEM)
+
+
+def _signature(path):
+    try:
+        return _signature_of(os.stat(path))
+    except FileNotFoundError:
+        return None
+
+
+def _signature_of(stat):
+    return stat.st_ino, stat.st_mtime_ns, stat.st_size
+
+
+def _stored(value):
+    '''Categories and difficulties may be None, stored as NONE'''
+    return NONE if value is None else value
+
+
+def _loaded(value):
+    return None if value == NONE else value
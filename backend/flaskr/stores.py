@@ -0,0 +1,181 @@
+import os
+import pickle
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+
+class MemoryStore:
+    '''
+    In-process key value store with optional TTL and size bound.
+
+    Entries expire ttl seconds after they were set and the least
+    recently used entries are dropped once max_entries is reached.
+    Values are kept as they are, so a value read with get() can be
+    changed in place. Other stores have to provide the same
+    get/set/delete/incr/update methods.
+    '''
+
+    def __init__(self, ttl=None, max_entries=None):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+
+    def get(self, key, default=None):
+        '''Returns the value of key or default if missing or expired'''
+        with self._lock:
+            return self._get(key, default)
+
+    def set(self, key, value, ttl=None):
+        '''Stores value under key, ttl overrides the store TTL'''
+        with self._lock:
+            self._set(key, value, ttl)
+
+    def update(self, key, function, ttl=None):
+        '''
+        Stores function(value of key or None) under key atomically
+
+        Returns:
+        the new value
+        '''
+        with self._lock:
+            value = function(self._get(key, None))
+            self._set(key, value, ttl)
+            return value
+
+    def delete(self, key):
+        '''Removes key from the store'''
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def incr(self, key):
+        '''Increments the integer stored under key and returns it'''
+        with self._lock:
+            value = self._entries.get(key, (0, None))[0] + 1
+            self._entries[key] = (value, None)
+            return value
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _get(self, key, default):
+        entry = self._entries.get(key)
+        if entry is None:
+            return default
+
+        value, expires_at = entry
+        if expires_at is not None and expires_at < time.monotonic():
+            del self._entries[key]
+            return default
+
+        self._entries.move_to_end(key)
+        return value
+
+    def _set(self, key, value, ttl):
+        ttl = self.ttl if ttl is None else ttl
+        expires_at = None if ttl is None else time.monotonic() + ttl
+
+        self._entries[key] = (value, expires_at)
+        self._entries.move_to_end(key)
+        if self.max_entries is not None:
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+
+class SqliteStore:
+    '''
+    Key value store in a local SQLite file shared by all the worker
+    processes of a host, a stand-in for an external shared cache.
+
+    Values are pickled and expire ttl seconds after they were set.
+    Each thread and process uses its own connection.
+    '''
+
+    def __init__(self, path, ttl=None):
+        self.path = os.path.abspath(path)
+        self.ttl = ttl
+        self._local = threading.local()
+        with self._connection() as connection:
+            connection.execute(
+                'CREATE TABLE IF NOT EXISTS entries '
+                '(key TEXT PRIMARY KEY, value BLOB, expires_at REAL)')
+
+    def get(self, key, default=None):
+        '''Returns the value of key or default if missing or expired'''
+        row = self._connection().execute(
+            'SELECT value, expires_at FROM entries WHERE key = ?',
+            (key,)).fetchone()
+
+        if row is None or (row[1] is not None and row[1] < time.time()):
+            return default
+
+        return pickle.loads(row[0])
+
+    def set(self, key, value, ttl=None):
+        '''Stores value under key, ttl overrides the store TTL'''
+        ttl = self.ttl if ttl is None else ttl
+        expires_at = None if ttl is None else time.time() + ttl
+
+        with self._connection() as connection:
+            connection.execute(
+                'INSERT OR REPLACE INTO entries VALUES (?, ?, ?)',
+                (key, pickle.dumps(value), expires_at))
+
+    def delete(self, key):
+        '''Removes key from the store'''
+        with self._connection() as connection:
+            connection.execute('DELETE FROM entries WHERE key = ?', (key,))
+
+    def incr(self, key):
+        '''Increments the integer stored under key and returns it'''
+        connection = self._connection()
+        with connection:
+            # takes the write lock first so concurrent increments serialize
+            connection.execute('BEGIN IMMEDIATE')
+            row = connection.execute(
+                'SELECT value FROM entries WHERE key = ?', (key,)).fetchone()
+            value = (pickle.loads(row[0]) if row else 0) + 1
+            connection.execute(
+                'INSERT OR REPLACE INTO entries VALUES (?, ?, NULL)',
+                (key, pickle.dumps(value)))
+        return value
+
+    def update(self, key, function, ttl=None):
+        '''
+        Stores function(value of key or None) under key atomically
+
+        Returns:
+        the new value
+        '''
+        ttl = self.ttl if ttl is None else ttl
+        connection = self._connection()
+        with connection:
+            # like incr(), other processes wait for the write lock
+            connection.execute('BEGIN IMMEDIATE')
+            row = connection.execute(
+                'SELECT value, expires_at FROM entries WHERE key = ?',
+                (key,)).fetchone()
+            now = time.time()
+            value = function(pickle.loads(row[0]) if row and (
+                row[1] is None or row[1] >= now) else None)
+            connection.execute(
+                'INSERT OR REPLACE INTO entries VALUES (?, ?, ?)',
+                (key, pickle.dumps(value),
+                 None if ttl is None else now + ttl))
+        return value
+
+    def purge(self):
+        '''Deletes the expired entries'''
+        with self._connection() as connection:
+            connection.execute(
+                'DELETE FROM entries WHERE expires_at < ?', (time.time(),))
+
+    def _connection(self):
+        # connections are not shared with forked worker processes
+        if getattr(self._local, 'pid', None) != os.getpid():
+            self._local.connection = sqlite3.connect(self.path, timeout=5)
+            self._local.connection.isolation_level = None
+            self._local.pid = os.getpid()
+        return self._local.connection
@@ -0,0 +1,53 @@
+QUESTION_FIELDS = ('question', 'answer', 'category', 'difficulty')
+
+
+def validate_question(data):
+    '''
+    Checks the fields of a new question
+
+    Parameters:
+    data (dict): question, answer, category and difficulty
+
+    Returns:
+    tuple: (question dict, None) if valid else (None, error message)
+    '''
+    for field in QUESTION_FIELDS:
+        if not data.get(field, None):
+            return None, '{} cannot be blank'.format(field)
+
+    for field in ('question', 'answer'):
+        if not isinstance(data[field], str):
+            return None, '{} must be a string'.format(field)
+        if not data[field].strip():
+            return None, '{} cannot be blank'.format(field)
+
+    question = {field: data[field] for field in QUESTION_FIELDS}
+
+    for field in ('category', 'difficulty'):
+        try:
+            question[field] = int(question[field])
+        except (TypeError, ValueError):
+            return None, '{} must be a number'.format(field)
+
+    return question, None
+
+
+def validate_search(data):
+    '''
+    Checks the searchTerm and page of a search
+
+    Parameters:
+    data (dict): searchTerm and an optional page, pages start at 1
+
+    Returns:
+    tuple: ((search term, page), None) if valid else (None, error message)
+    '''
+    if not isinstance(data['searchTerm'], str):
+        return None, 'searchTerm must be a string'
+
+    try:
+        page = int(data.get('page', 1))
+    except (TypeError, ValueError, OverflowError):
+        return None, 'page must be a number'
+
+    return (data['searchTerm'], max(page, 1)), None
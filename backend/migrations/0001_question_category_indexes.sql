@@ -0,0 +1,40 @@
+-- Makes questions.category an integer foreign key to categories.id and
+-- adds the indexes used by the category and difficulty lookups.
+-- Safe to run more than once, e.g. after restoring trivia.psql:
+--   psql trivia < migrations/0001_question_category_indexes.sql
+
+BEGIN;
+
+-- databases created by an older models.py have a varchar category
+DO $$
+BEGIN
+    IF (SELECT data_type FROM information_schema.columns
+        WHERE table_name = 'questions' AND column_name = 'category')
+            <> 'integer' THEN
+        ALTER TABLE questions ALTER COLUMN category TYPE integer
+            USING NULLIF(trim(category), '')::integer;
+    END IF;
+END $$;
+
+DO $$
+BEGIN
+    IF NOT EXISTS (SELECT 1 FROM pg_constraint
+                   WHERE conrelid = 'questions'::regclass
+                   AND contype = 'f') THEN
+        -- questions of missing categories would fail the constraint
+        UPDATE questions SET category = NULL
+            WHERE category NOT IN (SELECT id FROM categories);
+        ALTER TABLE questions ADD CONSTRAINT category
+            FOREIGN KEY (category) REFERENCES categories (id)
+            ON UPDATE CASCADE ON DELETE SET NULL;
+    END IF;
+END $$;
+
+CREATE INDEX IF NOT EXISTS ix_questions_category_id
+    ON questions (category, id);
+CREATE INDEX IF NOT EXISTS ix_questions_difficulty_id
+    ON questions (difficulty, id);
+
+COMMIT;
+
+ANALYZE questions;
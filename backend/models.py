@@ -1,12 +1,87 @@
 import os
-from sqlalchemy import Column, String, Integer, create_engine
-from flask_sqlalchemy import SQLAlchemy
+import itertools
+import threading
+import time
+from sqlalchemy import Column, String, Integer, ForeignKey, Index, \
+    create_engine, event, orm
+from sqlalchemy import exc
+from sqlalchemy.pool import NullPool, QueuePool
+from sqlalchemy.sql.dml import UpdateBase
+from flask_sqlalchemy import SQLAlchemy, SignallingSession
 import json
 
+migrations_path = os.path.join(os.path.dirname(__file__), 'migrations')
+
 database_name = "trivia"
-database_path = "postgres://{}/{}".format('localhost:5432', database_name)
+database_path = os.environ.get(
+    'DATABASE_URL',
+    "postgres://{}/{}".format('localhost:5432', database_name))
+
+# connection pool settings, read from app.config, then the environment
+POOL_SETTINGS = {
+    'DB_POOL_SIZE': 5,
+    'DB_MAX_OVERFLOW': 10,
+    # seconds to wait for a free connection before failing with 503
+    'DB_POOL_TIMEOUT': 10,
+    # seconds after which a connection is replaced, before Postgres or
+    # a proxy closes it
+    'DB_POOL_RECYCLE': 1800,
+    # checks connections on checkout, survives Postgres restarts
+    'DB_POOL_PRE_PING': True,
+    # connect through PgBouncer in transaction pooling mode
+    'DB_PGBOUNCER': False
+}
+
+# read replica settings, read the same way as POOL_SETTINGS
+REPLICA_SETTINGS = {
+    # comma separated database URLs, reads go to the primary if empty
+    'DATABASE_REPLICA_URLS': '',
+    # seconds between two health checks of the replicas
+    'DB_REPLICA_CHECK_INTERVAL': 10,
+    # seconds of replication lag after which a replica is left out
+    'DB_REPLICA_MAX_LAG': 10,
+    # seconds a client reads from the primary after a write
+    'DB_READ_YOUR_WRITES': 5
+}
+
+
+class RoutingSession(SignallingSession):
+    '''
+    Session sending its reads to a read replica once use_replica() is
+    called, everything else goes to the primary. A session keeps the
+    replica it started with and goes back to the primary for good
+    after its first write, see wrote_to_primary().
+    '''
+
+    def get_bind(self, mapper=None, clause=None):
+        if isinstance(clause, UpdateBase) or self._flushing:
+            self.info['replica'] = False
+            self.info['wrote'] = True
+
+        if self.info.get('replica'):
+            if 'replica_engine' not in self.info:
+                replicas = self.app.extensions.get('replicas')
+                self.info['replica_engine'] = replicas.engine() \
+                    if replicas is not None else None
+            if self.info['replica_engine'] is not None:
+                return self.info['replica_engine']
+
+        return SignallingSession.get_bind(self, mapper, clause)
+
+
+class RoutingSQLAlchemy(SQLAlchemy):
+    def create_session(self, options):
+        return orm.sessionmaker(class_=RoutingSession, db=self, **options)
+
+
+db = RoutingSQLAlchemy()
 
-db = SQLAlchemy()
+# callables notified with (action, list of question dicts, list of the
+# previous question dicts or None) after questions are committed, used
+# to keep in-process indexes up to date
+question_listeners = []
+# same for categories, called with (action, category dict)
+category_listeners = []
 
 
 def setup_db(app, database_path=database_path):
@@ -16,18 +91,349 @@ def setup_db(app, database_path=database_path):
     '''
     app.config["SQLALCHEMY_DATABASE_URI"] = database_path
     app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
+    app.config["SQLALCHEMY_ENGINE_OPTIONS"] = engine_options(
+        app, database_path)
+
+    # the replicas are binds without tables, see RoutingSession
+    binds = {'replica_{}'.format(number): url for number, url in
+             enumerate(replica_urls(app.config))}
+    app.config["SQLALCHEMY_BINDS"] = binds or None
+    app.extensions['replicas'] = ReplicaSet(
+        app, sorted(binds),
+        get_setting(app.config, 'DB_REPLICA_CHECK_INTERVAL'),
+        get_setting(app.config, 'DB_REPLICA_MAX_LAG')) if binds else None
+
     db.app = app
+    # the engine is created on first use, the app boots without the
+    # database, the schema is managed by migrate_db()
     db.init_app(app)
-    db.create_all()
+
+
+def migrate_db(migrations_path=migrations_path):
+    '''
+    Creates the missing tables and, on Postgres, applies the SQL files
+    of migrations_path that were not applied yet, in name order
+
+    Returns:
+    list: names of the applied migrations
+    '''
+    # the replicas get the schema through replication
+    db.create_all(bind=None)
+
+    if db.engine.dialect.name != 'postgresql':
+        return []
+
+    with db.engine.begin() as connection:
+        connection.execute(
+            'CREATE TABLE IF NOT EXISTS schema_migrations '
+            '(name varchar PRIMARY KEY, applied_at timestamp DEFAULT now())')
+        applied = {row[0] for row in connection.execute(
+            'SELECT name FROM schema_migrations')}
+
+    migrations = sorted(name for name in os.listdir(migrations_path)
+                        if name.endswith('.sql') and name not in applied)
+
+    for name in migrations:
+        with open(os.path.join(migrations_path, name)) as migration:
+            script = migration.read()
+
+        # the scripts manage their own transactions
+        connection = db.engine.raw_connection()
+        try:
+            connection.autocommit = True
+            cursor = connection.cursor()
+            cursor.execute(script)
+            cursor.execute(
+                'INSERT INTO schema_migrations (name) VALUES (%s)', (name,))
+        finally:
+            connection.close()
+
+    return migrations
+
+
+def get_setting(config, name):
+    '''
+    Returns a POOL_SETTINGS or REPLICA_SETTINGS value of config or the
+    environment
+    '''
+    if name in config:
+        return config[name]
+
+    default = POOL_SETTINGS[name] if name in POOL_SETTINGS \
+        else REPLICA_SETTINGS[name]
+    value = os.environ.get(name, None)
+
+    if value is None:
+        return default
+    if isinstance(default, bool):
+        return value.lower() in ('1', 'true', 'yes')
+    return type(default)(value)
+
+
+def engine_options(app, database_path):
+    '''Returns the SQLAlchemy engine options of a database'''
+    if not database_path.startswith('postgres'):
+        return {}
+
+    # sends executemany() batches as multi row INSERT ... VALUES
+    options = {'executemany_mode': 'values'}
+
+    if get_setting(app.config, 'DB_PGBOUNCER'):
+        # PgBouncer pools the server connections, a second pool in every
+        # worker would only hold on to them. psycopg2 never prepares
+        # statements, so transaction pooling mode works as it is.
+        options['poolclass'] = NullPool
+        return options
+
+    options.update({
+        'poolclass': MeteredQueuePool,
+        'pool_size': get_setting(app.config, 'DB_POOL_SIZE'),
+        'max_overflow': get_setting(app.config, 'DB_MAX_OVERFLOW'),
+        'pool_timeout': get_setting(app.config, 'DB_POOL_TIMEOUT'),
+        'pool_recycle': get_setting(app.config, 'DB_POOL_RECYCLE'),
+        'pool_pre_ping': get_setting(app.config, 'DB_POOL_PRE_PING')
+    })
+    return options
+
+
+class MeteredQueuePool(QueuePool):
+    '''
+    QueuePool that counts the checkouts which had to wait for a free
+    connection, the time spent waiting and the checkouts that timed out.
+    '''
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.waits = 0
+        self.wait_time = 0.0
+        self.timeouts = 0
+
+    def _do_get(self):
+        overflow = self._max_overflow if self._max_overflow >= 0 else None
+        must_wait = overflow is not None and \
+            self.checkedout() >= self.size() + overflow
+        started = time.monotonic()
+
+        try:
+            return super()._do_get()
+        except exc.TimeoutError:
+            self.timeouts += 1
+            raise
+        finally:
+            if must_wait:
+                self.waits += 1
+                self.wait_time += time.monotonic() - started
+
+
+def replica_urls(config):
+    '''Returns the DATABASE_REPLICA_URLS of config as a list'''
+    urls = get_setting(config, 'DATABASE_REPLICA_URLS') or []
+    if isinstance(urls, str):
+        urls = urls.split(',')
+
+    return [url.strip() for url in urls if url.strip()]
+
+
+def use_replica():
+    '''Sends the reads of the current session to a read replica'''
+    db.session.info['replica'] = True
+
+
+def wrote_to_primary():
+    '''Returns True if the current session flushed or executed a write'''
+    return db.session.info.get('wrote', False)
+
+
+class ReplicaSet:
+    '''
+    Read replicas of an app, the replica binds of SQLALCHEMY_BINDS.
+
+    engine() hands out the healthy replicas in turn. Every
+    check_interval seconds the replicas are checked with a query, a
+    replica that fails, or lags more than max_lag seconds behind the
+    primary, is left out until a later check succeeds. A replica that
+    drops its connections is left out right away. Without a healthy
+    replica the reads go to the primary.
+    '''
+
+    def __init__(self, app, binds, check_interval, max_lag):
+        self.app = app
+        self.binds = binds
+        self.check_interval = check_interval
+        self.max_lag = max_lag
+        self._lock = threading.Lock()
+        self._turn = itertools.count()
+        self._checked_at = None
+        self._listening = set()
+        self._status = {bind: {
+            'healthy': True,
+            'lag': None,
+            'error': None,
+            'reads': 0
+        } for bind in binds}
+
+    def engine(self):
+        '''Returns the engine of the next healthy replica, None if none'''
+        if self._checked_at is None or \
+                time.monotonic() - self._checked_at > self.check_interval:
+            self.check()
+
+        healthy = [bind for bind in self.binds
+                   if self._status[bind]['healthy']]
+        if not healthy:
+            return None
+
+        bind = healthy[next(self._turn) % len(healthy)]
+        self._status[bind]['reads'] += 1
+        return self._engine(bind)
+
+    def check(self):
+        '''Checks the health and replication lag of every replica now'''
+        with self._lock:
+            # one thread checks, the others keep using the last result
+            if self._checked_at is not None and \
+                    time.monotonic() - self._checked_at <= \
+                    self.check_interval:
+                return
+            self._checked_at = time.monotonic()
+
+        for bind in self.binds:
+            try:
+                with self._engine(bind).connect() as connection:
+                    lag = replication_lag(connection)
+            except exc.SQLAlchemyError as error:
+                self.mark_unhealthy(bind, error)
+                continue
+
+            healthy = lag is None or lag <= self.max_lag
+            self._status[bind].update({
+                'healthy': healthy,
+                'lag': lag,
+                'error': None if healthy else 'replication lag too high'
+            })
+
+    def mark_unhealthy(self, bind, error):
+        '''Leaves a replica out until its next successful check'''
+        self._status[bind].update({
+            'healthy': False,
+            'error': str(error).splitlines()[0]
+        })
+
+    def status(self):
+        '''Returns {bind: {healthy, lag, error, reads}} of the replicas'''
+        return {bind: dict(status) for bind, status in self._status.items()}
+
+    def _engine(self, bind):
+        engine = db.get_engine(self.app, bind)
+
+        if bind not in self._listening:
+            self._listening.add(bind)
+
+            @event.listens_for(engine, 'handle_error')
+            def on_error(context):
+                if context.is_disconnect:
+                    self.mark_unhealthy(bind, context.original_exception)
+
+        return engine
+
+
+def replication_lag(connection):
+    '''
+    Returns the seconds a Postgres standby lags behind its primary, 0
+    if it replayed everything it received, None if it is no standby
+    '''
+    if connection.dialect.name != 'postgresql':
+        connection.execute('SELECT 1')
+        return None
+
+    lag = connection.execute(
+        'SELECT CASE WHEN NOT pg_is_in_recovery() THEN NULL '
+        'WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 '
+        'ELSE extract(epoch FROM now() - pg_last_xact_replay_timestamp()) '
+        'END').scalar()
+
+    return None if lag is None else float(lag)
+
+
+def pool_metrics(engine):
+    '''Returns the state and counters of the connection pool of engine'''
+    pool = engine.pool
+    metrics = {'pool': pool.__class__.__name__}
+
+    if isinstance(pool, QueuePool):
+        metrics.update({
+            'size': pool.size(),
+            'checked_out': pool.checkedout(),
+            'checked_in': pool.checkedin(),
+            'overflow': pool.overflow()
+        })
+
+    if isinstance(pool, MeteredQueuePool):
+        metrics.update({
+            'waits': pool.waits,
+            'wait_time': round(pool.wait_time, 6),
+            'timeouts': pool.timeouts
+        })
+
+    return metrics
+
+
+def notify_question_listeners(action, question, previous=None):
+    '''
+    Calls every registered question listener
+
+    Parameters:
+    action (str): 'insert', 'update' or 'delete'
+    question (dict): formatted question
+    previous (dict): formatted question before an update, if known
+    '''
+    notify_question_listeners_many(
+        action, [question], None if previous is None else [previous])
+
+
+def notify_question_listeners_many(action, questions, previous=None):
+    '''
+    Calls every registered question listener once for the questions of
+    one transaction
+
+    Parameters:
+    action (str): 'insert', 'update' or 'delete'
+    questions (list): formatted questions
+    previous (list): formatted questions before an update, in the same
+        order, if known
+    '''
+    for listener in question_listeners:
+        listener(action, questions, previous)
+
+
+def notify_category_listeners(action, category):
+    '''
+    Calls every registered category listener
+
+    Parameters:
+    action (str): 'insert', 'update' or 'delete'
+    category (dict): formatted category
+    '''
+    for listener in category_listeners:
+        listener(action, category)
 
 
 class Question(db.Model):
     __tablename__ = 'questions'
+    # see migrations/0001_question_category_indexes.sql for existing data
+    __table_args__ = (
+        # category lookups ordered by id, the leading column also serves
+        # the category foreign key
+        Index('ix_questions_category_id', 'category', 'id'),
+        Index('ix_questions_difficulty_id', 'difficulty', 'id'),
+    )
 
     id = Column(Integer, primary_key=True)
     question = Column(String)
     answer = Column(String)
-    category = Column(String)
+    category = Column(Integer, ForeignKey(
+        'categories.id', name='category',
+        onupdate='CASCADE', ondelete='SET NULL'))
     difficulty = Column(Integer)
 
     def __init__(self, question, answer, category, difficulty):
@@ -39,13 +445,17 @@ class Question(db.Model):
     def insert(self):
         db.session.add(self)
         db.session.commit()
+        notify_question_listeners('insert', self.format())
 
     def update(self):
         db.session.commit()
+        notify_question_listeners('update', self.format())
 
     def delete(self):
+        question = self.format()
         db.session.delete(self)
         db.session.commit()
+        notify_question_listeners('delete', question)
 
     def format(self):
         return {
@@ -66,6 +476,21 @@ class Category(db.Model):
     def __init__(self, type):
         self.type = type
 
+    def insert(self):
+        db.session.add(self)
+        db.session.commit()
+        notify_category_listeners('insert', self.format())
+
+    def update(self):
+        db.session.commit()
+        notify_category_listeners('update', self.format())
+
+    def delete(self):
+        category = self.format()
+        db.session.delete(self)
+        db.session.commit()
+        notify_category_listeners('delete', category)
+
     def format(self):
         return {
             'id': self.id,
@@ -1,10 +1,60 @@
 import os
+import gzip
+import pickle
+import tempfile
+import time
 import unittest
 import json
-from flask_sqlalchemy import SQLAlchemy
+from unittest import mock
 
 from flaskr import create_app
-from models import setup_db, Question, Category
+from flaskr.quiz_index import QuizIndex
+from flaskr.quiz_sessions import QuizSession, shuffled_position
+from flaskr.serialization import stdlib_dumps
+from sqlalchemy.exc import SQLAlchemyError
+
+from models import db, Question, Category
+
+# TRIVIA_SERVING_MODE=asgi runs the test cases against flaskr.asgi
+SERVING_MODE = os.environ.get('TRIVIA_SERVING_MODE', 'wsgi')
+
+# skips the test cases of routes only the Flask app serves
+wsgi_only = unittest.skipIf(SERVING_MODE == 'asgi', 'not served by ASGI app')
+
+
+class ASGITestClient:
+    """Flask test client interface on top of the Starlette test client"""
+
+    def __init__(self, app):
+        from starlette.testclient import TestClient
+        self.client = TestClient(app)
+        # runs the startup handlers, close() runs the shutdown ones
+        self.client.__enter__()
+
+    def open(self, method, url, json=None, data=None, content_type=None,
+             headers=None):
+        headers = dict(headers or {})
+        if content_type:
+            headers['Content-Type'] = content_type
+
+        response = self.client.request(
+            method, url, json=json, data=data, headers=headers)
+        response.data = response.content
+        response.mimetype = response.headers.get(
+            'content-type', '').split(';')[0]
+        return response
+
+    def get(self, url, **kwargs):
+        return self.open('GET', url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.open('POST', url, **kwargs)
+
+    def delete(self, url, **kwargs):
+        return self.open('DELETE', url, **kwargs)
+
+    def close(self):
+        self.client.__exit__(None, None, None)
 
 
 class TriviaTestCase(unittest.TestCase):
@@ -12,23 +62,28 @@ class TriviaTestCase(unittest.TestCase):
 
     def setUp(self):
         """Define test variables and initialize app."""
-        self.app = create_app()
-        self.client = self.app.test_client
         self.database_name = "trivia_test"
         self.database_path = "postgres://{}/{}"\
             .format('localhost:5432', self.database_name)
-        setup_db(self.app, self.database_path)
+        # a second instance, e.g. a standby of trivia_test, the test
+        # database stands in for it if not set
+        self.replica_path = os.environ.get(
+            'TRIVIA_TEST_REPLICA_URL', self.database_path)
+        # the schema is created once by restoring trivia.psql and
+        # running flask migrate, see README
+        self.app = create_app({'DATABASE_URL': self.database_path})
+        self.client = self.app.test_client
 
-        # binds the app to the current context
-        with self.app.app_context():
-            self.db = SQLAlchemy()
-            self.db.init_app(self.app)
-            # create all tables
-            self.db.create_all()
+        if SERVING_MODE == 'asgi':
+            from flaskr.asgi import create_asgi_app
+            self.asgi_client = ASGITestClient(
+                create_asgi_app({'DATABASE_URL': self.database_path}))
+            self.client = lambda: self.asgi_client
 
     def tearDown(self):
         """Executed after reach test"""
-        pass
+        if SERVING_MODE == 'asgi':
+            self.asgi_client.close()
 
     """
     DONE
@@ -45,6 +100,180 @@ class TriviaTestCase(unittest.TestCase):
         self.assertEqual(data['success'], True)
         self.assertTrue(len(data['categories']))
 
+    @wsgi_only
+    def test_304_get_categories(self):
+        '''Get categories again with the ETag of the first response'''
+        res = self.client().get('/categories')
+        etag = res.headers['ETag']
+
+        res = self.client().get('/categories',
+                                headers={'If-None-Match': etag})
+
+        self.assertEqual(res.status_code, 304)
+        self.assertEqual(res.headers['ETag'], etag)
+        self.assertEqual(res.data, b'')
+
+    @wsgi_only
+    def test_category_cache_invalidation(self):
+        '''Categories change after a category is created and deleted'''
+        res = self.client().get('/categories')
+        etag = res.headers['ETag']
+
+        with self.app.app_context():
+            category = Category(type='Music')
+            category.insert()
+            category_id = category.id
+
+        res = self.client().get('/categories',
+                                headers={'If-None-Match': etag})
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['categories'][str(category_id)], 'Music')
+
+        with self.app.app_context():
+            Category.query.get(category_id).delete()
+
+        data = json.loads(self.client().get('/categories').data)
+        self.assertNotIn(str(category_id), data['categories'])
+
+    @wsgi_only
+    def test_304_get_questions(self):
+        '''Get questions again with the ETag of the first response'''
+        res = self.client().get('/questions')
+        etag = res.headers['ETag']
+
+        res = self.client().get('/questions',
+                                headers={'If-None-Match': etag})
+
+        self.assertEqual(res.status_code, 304)
+
+    @wsgi_only
+    def test_304_get_questions_other_worker(self):
+        '''Workers sharing the cache versions agree on the ETags'''
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        config = {
+            'DATABASE_URL': self.database_path,
+            'RESPONSE_CACHE_PATH': os.path.join(directory.name, 'cache.db'),
+            'RESPONSE_CACHE_TTL': 0.01
+        }
+        first, second = create_app(config), create_app(config)
+
+        etag = first.test_client().get('/questions?page=2').headers['ETag']
+        # the entry expires, the ETag still holds until a write
+        time.sleep(0.05)
+
+        res = second.test_client().get(
+            '/questions?page=2', headers={'If-None-Match': etag})
+        self.assertEqual(res.status_code, 304)
+
+        res = second.test_client().get('/questions?page=2')
+        self.assertEqual(res.headers['ETag'], etag)
+
+    @wsgi_only
+    def test_gzip_get_questions(self):
+        '''Get questions compressed, then a 304 for the gzip ETag'''
+        res = self.client().get('/questions',
+                                headers={'Accept-Encoding': 'gzip'})
+        etag = res.headers['ETag']
+        data = json.loads(gzip.decompress(res.data))
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(res.headers['Content-Encoding'], 'gzip')
+        self.assertIn('Accept-Encoding', res.headers['Vary'])
+        self.assertTrue(etag.endswith('-gzip"'))
+        self.assertTrue(len(data['questions']))
+
+        res = self.client().get('/questions', headers={
+            'Accept-Encoding': 'gzip',
+            'If-None-Match': etag
+        })
+
+        self.assertEqual(res.status_code, 304)
+        self.assertEqual(res.headers['ETag'], etag)
+
+    @wsgi_only
+    def test_response_cache_invalidation(self):
+        '''Creating a question only outdates its own cached lists'''
+        res = self.client().get('/questions')
+        total = json.loads(res.data)['total_questions']
+        self.client().get('/categories/2/questions')
+
+        versions = self.app.extensions['response_cache'].versions
+        art_version = versions.get('version:category:2', 0)
+        geography_version = versions.get('version:category:3', 0)
+
+        res = self.client().post('/questions', json={
+            'question': 'What is the capital of Burkina Faso?',
+            'answer': 'Ouagadougou',
+            'category': 3,
+            'difficulty': 4
+        })
+        question_id = json.loads(res.data)['created']
+
+        res = self.client().get('/questions')
+        data = json.loads(res.data)
+        self.client().delete('/questions/{}'.format(question_id))
+
+        self.assertEqual(data['total_questions'], total + 1)
+        self.assertEqual(versions.get('version:category:2', 0), art_version)
+        self.assertGreater(versions.get('version:category:3', 0),
+                           geography_version)
+
+    @wsgi_only
+    def test_batch_outdates_every_tag_once(self):
+        '''A batch bumps the version of each changed tag once'''
+        versions = self.app.extensions['response_cache'].versions
+
+        def version(tag):
+            return versions.get('version:' + tag, 0)
+
+        before = {tag: version(tag)
+                  for tag in ('questions', 'category:1', 'category:2')}
+        res = self.client().post('/questions/batch', json={'questions': [
+            {'question': 'Batch question {}?'.format(number),
+             'answer': 'Yes', 'category': category, 'difficulty': 1}
+            for number, category in enumerate((1, 1, 2))]})
+        ids = [result['id'] for result in json.loads(res.data)['results']]
+        self.addCleanup(self.client().delete, '/questions/batch',
+                        json={'ids': ids})
+
+        self.assertEqual({tag: version(tag) - before[tag] for tag in before},
+                         {'questions': 1, 'category:1': 1, 'category:2': 1})
+
+        before = {tag: version(tag) for tag in before}
+        self.client().delete('/questions/batch', json={'ids': ids})
+
+        self.assertEqual({tag: version(tag) - before[tag] for tag in before},
+                         {'questions': 1, 'category:1': 1, 'category:2': 1})
+
+    @wsgi_only
+    def test_batch_update_outdates_previous_category(self):
+        '''Moving a question outdates the list of its old category'''
+        app = create_app({'DATABASE_URL': self.database_path})
+        client = app.test_client()
+        res = client.post('/questions/batch', json={'questions': [
+            {'question': 'Which painter cut off his ear?',
+             'answer': 'Van Gogh', 'category': 1, 'difficulty': 2}]})
+        question_id = json.loads(res.data)['results'][0]['id']
+        self.addCleanup(client.delete, '/questions/{}'.format(question_id))
+
+        def category_ids(category):
+            res = client.get('/categories/{}/questions'.format(category))
+            return [question['id']
+                    for question in json.loads(res.data)['questions']]
+
+        self.assertIn(question_id, category_ids(1))
+        # a quiz index that does not know the question yet, like a
+        # shared one before its rebuild
+        app.extensions['quiz_index'].load([])
+        client.patch('/questions/batch', json={'questions': [
+            {'id': question_id, 'category': 2}]})
+
+        self.assertNotIn(question_id, category_ids(1))
+        self.assertIn(question_id, category_ids(2))
+
     def test_get_questions(self):
         '''Get list of questions'''
         res = self.client().get('/questions')
@@ -56,6 +285,27 @@ class TriviaTestCase(unittest.TestCase):
         self.assertTrue(len(data['questions']))
         self.assertTrue(data['total_questions'])
 
+    @wsgi_only
+    def test_get_questions_custom_json_dumps(self):
+        '''Encode the questions with the JSON_DUMPS of the config'''
+        encoded = []
+
+        def dumps(obj):
+            encoded.append(obj)
+            return stdlib_dumps(obj)
+
+        client = create_app({
+            'DATABASE_URL': self.database_path,
+            'JSON_DUMPS': dumps
+        }).test_client()
+        data = json.loads(client.get('/questions').data)
+
+        self.assertTrue(encoded)
+        self.assertEqual(sorted(data['questions'][0]), [
+            'answer', 'category', 'difficulty', 'id', 'question'])
+        self.assertEqual(data['questions'], json.loads(
+            self.client().get('/questions').data)['questions'])
+
     def test_404_get_questions(self):
         '''Show error if invalid page number is provided'''
         res = self.client().get('/questions?page=9999999')
@@ -66,6 +316,47 @@ class TriviaTestCase(unittest.TestCase):
         self.assertEqual(data['error'], 404)
         self.assertEqual(data['message'], 'questions not found')
 
+    def test_get_questions_after_cursor(self):
+        '''Walk all questions with cursor pagination'''
+        res = self.client().get('/questions?page=1')
+        total = json.loads(res.data)['total_questions']
+
+        question_ids = []
+        cursor = 0
+        while cursor is not None:
+            res = self.client().get(
+                '/questions?after={}&limit=7'.format(cursor))
+            data = json.loads(res.data)
+
+            self.assertEqual(res.status_code, 200)
+            self.assertNotIn('total_questions', data)
+            self.assertTrue(len(data['questions']) <= 7)
+            question_ids += [question['id'] for question in data['questions']]
+            cursor = data['next_cursor']
+
+        self.assertEqual(len(question_ids), total)
+        self.assertEqual(question_ids, sorted(question_ids))
+
+    def test_get_questions_by_category_after_cursor(self):
+        '''Get questions of a category after a cursor with total count'''
+        res = self.client().get(
+            '/categories/2/questions?after=16&limit=2&count=true')
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual([question['id'] for question in data['questions']],
+                         [17, 18])
+        self.assertEqual(data['next_cursor'], 18)
+        self.assertEqual(data['total_questions'], 4)
+
+    def test_422_get_questions_after_cursor(self):
+        '''Fail to get questions with a too large limit'''
+        res = self.client().get('/questions?after=0&limit=100000')
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 422)
+        self.assertEqual(data['success'], False)
+
     def missing_field_create_question(self, question, missing):
         '''Try to create a new question with a missing field'''
         missing_field_question = {}
@@ -125,6 +416,19 @@ class TriviaTestCase(unittest.TestCase):
         self.missing_field_create_question(
             question=new_question, missing='difficulty')
 
+    def test_422_create_question_unknown_category(self):
+        '''Fail to create a question of a non existing category'''
+        res = self.client().post('/questions', json={
+            'question': 'Which category is this?',
+            'answer': 'None',
+            'category': 9999999,
+            'difficulty': 1
+        })
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 422)
+        self.assertEqual(data['message'], 'category not found')
+
     def test_search_question(self):
         '''Search for question'''
         search_json = {
@@ -154,6 +458,30 @@ class TriviaTestCase(unittest.TestCase):
             data['message'], 'no questions found with term - {}'.format(
                 search_json['searchTerm']))
 
+    def test_422_search_question(self):
+        '''Fail to search with a searchTerm or page of the wrong type'''
+        for search_json, message in (
+                ({'searchTerm': ['movie']}, 'searchTerm must be a string'),
+                ({'searchTerm': {'a': 1}}, 'searchTerm must be a string'),
+                ({'searchTerm': 'a', 'page': 'two'}, 'page must be a number'),
+                ({'searchTerm': 'a', 'page': [1]}, 'page must be a number')):
+            res = self.client().post('/questions', json=search_json)
+            data = json.loads(res.data)
+
+            self.assertEqual(res.status_code, 422)
+            self.assertEqual(data['success'], False)
+            self.assertEqual(data['message'], message)
+
+        # JSON numbers out of the float range are parsed as infinity
+        for page in ('1e400', 'Infinity'):
+            res = self.client().post(
+                '/questions', content_type='application/json',
+                data='{"searchTerm": "a", "page": ' + page + '}')
+            data = json.loads(res.data)
+
+            self.assertEqual(res.status_code, 422)
+            self.assertEqual(data['message'], 'page must be a number')
+
     def test_404_search_question(self):
         '''Fail to search for question with non existign term'''
         search_json = {
@@ -169,6 +497,303 @@ class TriviaTestCase(unittest.TestCase):
             data['message'], 'no questions found with term - {}'.format(
                 search_json['searchTerm']))
 
+    def test_search_question_by_answer(self):
+        '''Search finds questions by their answer'''
+        res = self.client().post('/questions', json={'searchTerm': 'uruguay'})
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['questions'][0]['answer'], 'Uruguay')
+
+    @wsgi_only
+    def test_search_cache_invalidated_by_writes(self):
+        '''Cached searches share an entry per normalized term and page'''
+        question = {'question': 'Which lake is the deepest in the world?',
+                    'answer': 'Baikal', 'category': 3, 'difficulty': 2}
+        res = self.client().post('/questions/batch', json={
+            'questions': [question]})
+        ids = [json.loads(res.data)['results'][0]['id']]
+
+        res = self.client().post('/questions', json={'searchTerm': 'Baikal'})
+        self.assertEqual(json.loads(res.data)['total_questions'], 1)
+
+        res = self.client().post('/questions/batch', json={'questions': [
+            dict(question, question='Which lake holds the Nerpa seal?')]})
+        ids.append(json.loads(res.data)['results'][0]['id'])
+
+        res = self.client().post('/questions', json={
+            'searchTerm': ' baikal? ', 'page': 1})
+        self.assertEqual(json.loads(res.data)['total_questions'], 2)
+
+        self.client().delete('/questions/batch', json={'ids': ids})
+
+    @wsgi_only
+    def test_autocomplete_questions(self):
+        '''Complete the last word of the search box'''
+        res = self.client().get('/questions/autocomplete?q=Who+disc')
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['success'], True)
+        self.assertIn('who discovered', data['suggestions'])
+
+        res = self.client().get('/questions/autocomplete?q=wh&limit=1')
+        self.assertEqual(len(json.loads(res.data)['suggestions']), 1)
+
+    @wsgi_only
+    def test_422_autocomplete_limit(self):
+        '''Fail to autocomplete with a limit out of range'''
+        res = self.client().get('/questions/autocomplete?q=a&limit=0')
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 422)
+        self.assertEqual(data['success'], False)
+
+    def test_search_created_and_deleted_question(self):
+        '''Search index follows created and deleted questions'''
+        search_json = {
+            'searchTerm': 'zanzibar'
+        }
+        # load the search index before creating the question
+        self.client().post('/questions', json=search_json)
+
+        res = self.client().post('/questions', json={
+            'question': 'Which archipelago is Zanzibar City part of?',
+            'answer': 'Zanzibar',
+            'category': 3,
+            'difficulty': 2
+        })
+        question_id = json.loads(res.data)['created']
+
+        res = self.client().post('/questions', json=search_json)
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual([question['id'] for question in data['questions']],
+                         [question_id])
+
+        self.client().delete('/questions/{}'.format(question_id))
+        res = self.client().post('/questions', json=search_json)
+
+        self.assertEqual(res.status_code, 404)
+
+    @wsgi_only
+    def test_import_questions(self):
+        '''Import NDJSON questions, invalid rows are reported'''
+        rows = [
+            {'question': 'Which marsupial is known as the happiest animal?',
+             'answer': 'Quokka', 'category': 1, 'difficulty': 2},
+            {'question': 'On which island do most quokkas live?',
+             'answer': '', 'category': 3, 'difficulty': 3},
+            {'question': 'Which Australian state is home to the quokka?',
+             'answer': 'Western Australia', 'category': 3, 'difficulty': 3}
+        ]
+        body = '\n'.join(json.dumps(row) for row in rows)
+
+        res = self.client().post('/questions/import', data=body,
+                                 content_type='application/x-ndjson')
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['success'], True)
+        self.assertEqual(data['imported'], 2)
+        self.assertEqual(data['failed'], 1)
+        self.assertEqual(data['errors'], [
+            {'line': 2, 'message': 'answer cannot be blank'}])
+
+        res = self.client().post('/questions', json={'searchTerm': 'quokka'})
+        data = json.loads(res.data)
+        self.assertEqual(data['total_questions'], 2)
+
+        for question in data['questions']:
+            self.client().delete('/questions/{}'.format(question['id']))
+
+    @wsgi_only
+    def test_import_questions_not_strings(self):
+        '''Import rejects a question or answer that is not a string'''
+        rows = [
+            {'question': ['not', 'a', 'string'], 'answer': 'List',
+             'category': 1, 'difficulty': 1},
+            {'question': 'Which type is this answer?', 'answer': {'a': 1},
+             'category': 1, 'difficulty': 1}
+        ]
+        body = '\n'.join(json.dumps(row) for row in rows)
+
+        res = self.client().post('/questions/import', data=body,
+                                 content_type='application/x-ndjson')
+        data = json.loads(res.data)
+
+        self.assertEqual(data['imported'], 0)
+        self.assertEqual(data['errors'], [
+            {'line': 1, 'message': 'question must be a string'},
+            {'line': 2, 'message': 'answer must be a string'}])
+
+    @wsgi_only
+    def test_import_questions_csv(self):
+        '''Import CSV questions with a header row'''
+        body = 'question,answer,category,difficulty\n' \
+            'Which planet has the moon Titan?,Saturn,1,2\n'
+
+        res = self.client().post('/questions/import', data=body,
+                                 content_type='text/csv')
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['imported'], 1)
+
+        res = self.client().post('/questions', json={'searchTerm': 'titan'})
+        for question in json.loads(res.data)['questions']:
+            self.client().delete('/questions/{}'.format(question['id']))
+
+    @wsgi_only
+    def test_batch_questions(self):
+        '''Create, update and delete questions in batches'''
+        res = self.client().post('/questions/batch', json={'questions': [
+            {'question': 'Which bird lays the largest egg?',
+             'answer': 'Ostrich', 'category': 1, 'difficulty': 2},
+            {'question': 'Which bird cannot fly?', 'answer': '',
+             'category': 1, 'difficulty': 1},
+            {'question': 'Which bird is the national symbol of the USA?',
+             'answer': 'Bald eagle', 'category': 4, 'difficulty': 1}
+        ]})
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['created'], 2)
+        self.assertEqual(data['failed'], 1)
+        self.assertEqual(data['results'][1], {
+            'status': 422, 'message': 'answer cannot be blank'})
+        ostrich, eagle = data['results'][0]['id'], data['results'][2]['id']
+
+        res = self.client().patch('/questions/batch', json={'questions': [
+            {'id': ostrich, 'difficulty': 3},
+            {'id': eagle, 'category': 999999},
+            {'id': 9999999, 'answer': 'Kiwi'}
+        ]})
+        data = json.loads(res.data)
+
+        self.assertEqual(data['updated'], 1)
+        self.assertEqual([result['status'] for result in data['results']],
+                         [200, 422, 404])
+
+        res = self.client().post('/questions', json={'searchTerm': 'egg'})
+        question, = json.loads(res.data)['questions']
+        self.assertEqual(question['difficulty'], 3)
+
+        res = self.client().delete('/questions/batch', json={
+            'ids': [ostrich, eagle, 9999999]})
+        data = json.loads(res.data)
+
+        self.assertEqual(data['deleted'], 2)
+        self.assertEqual(data['results'], [
+            {'id': ostrich, 'status': 200}, {'id': eagle, 'status': 200},
+            {'id': 9999999, 'status': 404}])
+
+        res = self.client().post('/questions', json={'searchTerm': 'egg'})
+        self.assertEqual(res.status_code, 404)
+
+    @wsgi_only
+    def test_batch_questions_failed_transaction(self):
+        '''A failed batch fails every item, updates keep their ids'''
+        question = {'question': 'Which bird lays the largest egg?',
+                    'answer': 'Ostrich', 'category': 1, 'difficulty': 2}
+        client = self.client()
+
+        with mock.patch.object(db.session, 'commit',
+                               side_effect=SQLAlchemyError('failed')):
+            created = json.loads(client.post('/questions/batch', json={
+                'questions': [question]}).data)
+            updated = json.loads(client.patch('/questions/batch', json={
+                'questions': [{'id': 5, 'difficulty': 1}]}).data)
+
+        message = 'batch failed: SQLAlchemyError'
+        self.assertEqual(created['results'], [
+            {'status': 422, 'message': message}])
+        self.assertEqual(updated['results'], [
+            {'id': 5, 'status': 422, 'message': message}])
+
+    @wsgi_only
+    def test_batch_questions_not_strings(self):
+        '''Batch create and update reject lists and dicts as text'''
+        res = self.client().post('/questions/batch', json={'questions': [
+            {'question': ['bad'], 'answer': 'List', 'category': 1,
+             'difficulty': 1},
+            {'question': 'Which type?', 'answer': {'bad': True},
+             'category': 1, 'difficulty': 1}
+        ]})
+        data = json.loads(res.data)
+
+        self.assertEqual(data['created'], 0)
+        self.assertEqual(data['results'], [
+            {'status': 422, 'message': 'question must be a string'},
+            {'status': 422, 'message': 'answer must be a string'}])
+
+        res = self.client().patch('/questions/batch', json={
+            'questions': [{'id': 5, 'answer': ['bad']}]})
+        data = json.loads(res.data)
+
+        self.assertEqual(data['results'], [
+            {'status': 422, 'message': 'answer must be a string'}])
+
+    def test_422_create_question_not_string(self):
+        '''Create a question with a dict as question text'''
+        res = self.client().post('/questions', json={
+            'question': {'text': 'Which?'}, 'answer': 'This',
+            'category': 1, 'difficulty': 1})
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 422)
+        self.assertEqual(data['message'], 'question must be a string')
+
+    @wsgi_only
+    def test_422_batch_questions(self):
+        '''A batch needs a non empty list of items'''
+        res = self.client().delete('/questions/batch', json={'ids': []})
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 422)
+        self.assertEqual(data['success'], False)
+
+    @wsgi_only
+    def test_export_questions(self):
+        '''Export every question as NDJSON and CSV'''
+        total = json.loads(self.client().get('/questions').data)[
+            'total_questions']
+
+        res = self.client().get('/questions/export')
+        rows = [json.loads(line) for line in res.data.splitlines()]
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(res.mimetype, 'application/x-ndjson')
+        self.assertEqual(len(rows), total)
+        self.assertEqual(set(rows[0]), {
+            'id', 'question', 'answer', 'category', 'difficulty'})
+
+        res = self.client().get('/questions/export?format=csv')
+        lines = res.data.decode().splitlines()
+
+        self.assertEqual(lines[0], 'id,question,answer,category,difficulty')
+        self.assertEqual(len(lines), total + 1)
+
+    @wsgi_only
+    def test_stream_questions(self):
+        '''Stream the questions of a category and difficulty'''
+        res = self.client().get('/questions/stream?category=2&difficulty=3')
+        rows = [json.loads(line) for line in res.data.splitlines()]
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(res.mimetype, 'application/x-ndjson')
+        self.assertEqual([row['id'] for row in rows], [17])
+
+    @wsgi_only
+    def test_422_stream_questions(self):
+        '''Fail to stream questions of an invalid category'''
+        res = self.client().get('/questions/stream?category=art')
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 422)
+        self.assertEqual(data['message'], 'category must be a number')
+
     def test_delete_question(self):
         '''Delete a question'''
         # To work in any case, first add a question
@@ -278,6 +903,580 @@ class TriviaTestCase(unittest.TestCase):
         self.assertTrue(data['question']['category'],
                         quiz_info['quiz_category']['id'])
 
+    def test_get_quiz_no_question_left(self):
+        '''Get no quiz question once all of the category was played'''
+        quiz_info = {
+            'previous_questions': [16, 17, 18, 19],
+            'quiz_category': {
+                'id': 2,
+                'type': 'Art'
+            }
+        }
+        res = self.client().post('/quizzes', json=quiz_info)
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['success'], True)
+        self.assertIsNone(data['question'])
+
+    def test_get_quiz_new_question(self):
+        '''Get a question created after the quiz index was loaded'''
+        quiz_info = {
+            'previous_questions': [16, 17, 18, 19],
+            'quiz_category': {
+                'id': 2,
+                'type': 'Art'
+            }
+        }
+        # load the quiz index before creating the question
+        self.client().post('/quizzes', json=quiz_info)
+
+        res = self.client().post('/questions', json={
+            'question': 'Who painted The Starry Night?',
+            'answer': 'Vincent van Gogh',
+            'category': 2,
+            'difficulty': 2
+        })
+        question_id = json.loads(res.data)['created']
+
+        res = self.client().post('/quizzes', json=quiz_info)
+        data = json.loads(res.data)
+        self.client().delete('/questions/{}'.format(question_id))
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['question']['id'], question_id)
+
+    def test_422_get_quiz(self):
+        '''Get quiz with an invalid category'''
+        res = self.client().post('/quizzes', json={
+            'quiz_category': {'type': 'Art'}
+        })
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 422)
+        self.assertEqual(data['success'], False)
+        self.assertEqual(data['error'], 422)
+
+    def test_get_quiz_difficulty_weights(self):
+        '''Get quiz questions of the only weighted difficulty'''
+        previous_questions = []
+
+        for _ in range(3):
+            res = self.client().post('/quizzes', json={
+                'previous_questions': previous_questions,
+                'quiz_category': {'id': 0, 'type': 'click'},
+                'difficulty': {'4': 1}
+            })
+            data = json.loads(res.data)
+
+            self.assertEqual(res.status_code, 200)
+            self.assertEqual(data['question']['difficulty'], 4)
+            self.assertNotIn(data['question']['id'], previous_questions)
+            previous_questions.append(data['question']['id'])
+
+    def test_get_quiz_difficulty_ramp(self):
+        '''Get a quiz question with a ramping difficulty'''
+        res = self.client().post('/quizzes', json={
+            'previous_questions': [],
+            'quiz_category': {'id': 1, 'type': 'Science'},
+            'difficulty': 'ramp'
+        })
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['question']['category'], 1)
+
+    def test_get_quiz_batch(self):
+        '''Get distinct quiz questions of a category in one request'''
+        res = self.client().post('/quizzes', json={
+            'previous_questions': [],
+            'quiz_category': {'id': 2, 'type': 'Art'},
+            'count': 3
+        })
+        data = json.loads(res.data)
+        question_ids = [question['id'] for question in data['questions']]
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['success'], True)
+        self.assertEqual(len(set(question_ids)), 3)
+        self.assertTrue(all(question['category'] == 2
+                            for question in data['questions']))
+
+        # only the question not played yet is left
+        data = json.loads(self.client().post('/quizzes', json={
+            'previous_questions': question_ids,
+            'quiz_category': {'id': 2, 'type': 'Art'},
+            'count': 10
+        }).data)
+
+        self.assertEqual(len(data['questions']), 1)
+        self.assertNotIn(data['questions'][0]['id'], question_ids)
+
+    def test_422_get_quiz_batch(self):
+        '''Get a quiz batch with an invalid count'''
+        res = self.client().post('/quizzes', json={
+            'previous_questions': [],
+            'quiz_category': {'id': 2, 'type': 'Art'},
+            'count': 0
+        })
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 422)
+        self.assertEqual(data['message'], 'count must be between 1 and 50')
+
+    def test_422_get_quiz_difficulty(self):
+        '''Get quiz with an invalid difficulty'''
+        res = self.client().post('/quizzes', json={
+            'previous_questions': [],
+            'quiz_category': {'id': 1, 'type': 'Science'},
+            'difficulty': 'hard'
+        })
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 422)
+        self.assertEqual(data['message'], 'invalid difficulty')
+
+    def test_422_get_quiz_difficulty_too_large(self):
+        '''Get quiz with a difficulty too large for a float'''
+        for difficulty in (10 ** 400, {'1': 10 ** 400}):
+            res = self.client().post('/quizzes', json={
+                'previous_questions': [],
+                'quiz_category': {'id': 1, 'type': 'Science'},
+                'difficulty': difficulty
+            })
+            data = json.loads(res.data)
+
+            self.assertEqual(res.status_code, 422)
+            self.assertEqual(data['message'], 'invalid difficulty')
+
+    @wsgi_only
+    def test_quiz_session(self):
+        '''Play a whole category through a quiz session'''
+        res = self.client().post('/quizzes/sessions', json={
+            'quiz_category': {
+                'id': 2,
+                'type': 'Art'
+            }
+        })
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['success'], True)
+        self.assertEqual(data['total_questions'], 4)
+
+        session_url = '/quizzes/sessions/{}/next'.format(data['session_id'])
+        played = []
+        for _ in range(4):
+            data = json.loads(self.client().post(session_url).data)
+            self.assertEqual(data['question']['category'], 2)
+            played.append(data['question']['id'])
+
+        self.assertEqual(sorted(played), [16, 17, 18, 19])
+
+        data = json.loads(self.client().post(session_url).data)
+        self.assertIsNone(data['question'])
+
+    @wsgi_only
+    def test_quiz_session_shared_between_workers(self):
+        '''A session of QUIZ_SESSION_PATH goes on in another worker'''
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        config = {
+            'DATABASE_URL': self.database_path,
+            'QUIZ_SESSION_PATH': os.path.join(directory.name, 'sessions.db')
+        }
+        workers = [create_app(config).test_client() for _ in range(2)]
+
+        data = json.loads(workers[0].post('/quizzes/sessions', json={
+            'quiz_category': {'id': 2}}).data)
+        session_url = '/quizzes/sessions/{}/next'.format(data['session_id'])
+        played = [json.loads(workers[step % 2].post(session_url).data)[
+            'question']['id'] for step in range(4)]
+
+        self.assertEqual(sorted(played), [16, 17, 18, 19])
+        self.assertIsNone(json.loads(workers[1].post(session_url).data)[
+            'question'])
+
+    def test_quiz_session_stays_small(self):
+        '''A long session plays every question once in a bounded size'''
+        quiz_index = QuizIndex()
+        quiz_index.load((question_id, 1, 1) for question_id in range(5000))
+        session = QuizSession(1, quiz_index.count(1))
+
+        played = set()
+        sizes = []
+        for _ in range(5000):
+            played.add(session.next_id(quiz_index))
+            sizes.append(len(pickle.dumps(session)))
+
+        self.assertEqual(played, set(range(5000)))
+        self.assertIsNone(session.next_id(quiz_index))
+        self.assertLess(max(sizes), 4096)
+
+    def test_shuffled_position(self):
+        '''Every seed gives a permutation, the same in every process'''
+        for size in (1, 2, 3, 10, 100):
+            positions = [shuffled_position(position, size, 7)
+                         for position in range(size)]
+            self.assertEqual(sorted(positions), list(range(size)))
+        self.assertEqual(
+            [shuffled_position(position, 100, 7) for position in range(5)],
+            positions[:5])
+        self.assertNotEqual(
+            [shuffled_position(position, 100, 8) for position in range(100)],
+            positions)
+
+    def create_app_with_decks(self):
+        '''Returns an app serving quizzes from freshly generated decks'''
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        app = create_app({
+            'DATABASE_URL': self.database_path,
+            'QUIZ_DECKS_PATH': os.path.join(directory.name, 'quiz.decks')
+        })
+        app.extensions['decks'].check_interval = 0
+
+        result = app.test_cli_runner().invoke(
+            args=['generate-decks', '--decks', '3', '--seed', '1'])
+        self.assertEqual(result.exit_code, 0, result.output)
+
+        return app
+
+    @wsgi_only
+    def test_generate_decks_path_from_environment(self):
+        '''QUIZ_DECKS_PATH is read from the environment'''
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        path = os.path.join(directory.name, 'env.decks')
+
+        with mock.patch.dict(os.environ, {'QUIZ_DECKS_PATH': path}):
+            app = create_app({'DATABASE_URL': self.database_path})
+        result = app.test_cli_runner().invoke(
+            args=['generate-decks', '--decks', '1'])
+
+        self.assertEqual(result.exit_code, 0, result.output)
+        self.assertTrue(os.path.exists(path))
+        self.assertEqual(app.extensions['decks'].count(2), 1)
+
+    @wsgi_only
+    def test_quiz_from_decks(self):
+        '''Play a category by deck position'''
+        client = self.create_app_with_decks().test_client()
+        quiz_json = {
+            'quiz_category': {'id': 2, 'type': 'Art'},
+            'previous_questions': [],
+            'count': 3,
+            'deck': None
+        }
+
+        data = json.loads(client.post('/quizzes', json=quiz_json).data)
+        played = [question['id'] for question in data['questions']]
+
+        self.assertEqual(len(played), 3)
+        self.assertEqual(data['deck']['position'], 3)
+
+        data = json.loads(client.post('/quizzes', json=dict(
+            quiz_json, previous_questions=played, deck=data['deck'])).data)
+        played += [question['id'] for question in data['questions']]
+
+        self.assertEqual(sorted(played), [16, 17, 18, 19])
+        self.assertEqual(data['deck']['position'], 4)
+
+        # without "deck" the quiz index is used as before
+        data = json.loads(client.post('/quizzes', json={
+            'quiz_category': {'id': 2}, 'previous_questions': []}).data)
+        self.assertNotIn('deck', data)
+        self.assertEqual(data['question']['category'], 2)
+
+    @wsgi_only
+    def test_422_quiz_deck(self):
+        '''Fail to play a deck that does not exist'''
+        client = self.create_app_with_decks().test_client()
+        generation = json.loads(client.post('/quizzes', json={
+            'deck': None}).data)['deck']['generation']
+
+        res = client.post('/quizzes', json={'deck': {
+            'id': 99, 'position': 0, 'generation': generation}})
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 422)
+        self.assertEqual(data['message'], 'invalid deck')
+
+    @wsgi_only
+    def test_quiz_session_from_decks(self):
+        '''A deck session goes on without repeats after new decks'''
+        app = self.create_app_with_decks()
+        client = app.test_client()
+
+        data = json.loads(client.post('/quizzes/sessions', json={
+            'quiz_category': {'id': 2}}).data)
+        self.assertEqual(data['total_questions'], 4)
+        session_url = '/quizzes/sessions/{}/next'.format(data['session_id'])
+
+        played = [json.loads(client.post(session_url).data)['question']['id']
+                  for _ in range(2)]
+        # sure to be a newer generation
+        time.sleep(0.002)
+        app.test_cli_runner().invoke(args=['generate-decks', '--seed', '2'])
+        played += [json.loads(client.post(session_url).data)['question'][
+            'id'] for _ in range(2)]
+
+        self.assertEqual(sorted(played), [16, 17, 18, 19])
+        self.assertIsNone(json.loads(client.post(session_url).data)[
+            'question'])
+
+    @wsgi_only
+    def test_404_quiz_session(self):
+        '''Get next question of a non existing quiz session'''
+        res = self.client().post('/quizzes/sessions/unknown/next')
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 404)
+        self.assertEqual(data['success'], False)
+        self.assertEqual(data['message'], 'quiz session not found')
+
+    @wsgi_only
+    def test_get_pool_metrics(self):
+        '''Get the connection pool metrics'''
+        res = self.client().get('/metrics/pool')
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['success'], True)
+        self.assertTrue(data['pool']['pool'])
+
+    @wsgi_only
+    def test_shared_quiz_index(self):
+        '''Workers share one quiz index file, rebuilt after a write'''
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        config = {
+            'DATABASE_URL': self.database_path,
+            'QUIZ_INDEX_PATH': os.path.join(directory.name, 'quiz.index')
+        }
+        # two workers of a host
+        writer, reader = create_app(config), create_app(config)
+        for app in (writer, reader):
+            app.extensions['quiz_index'].check_interval = 0
+            app.extensions['quiz_index'].rebuild_delay = 0
+
+        total = json.loads(writer.test_client().get('/questions').data)[
+            'total_questions']
+        reader_index = reader.extensions['quiz_index']
+        # mapped from the file the writer built, not loaded again
+        self.assertFalse(reader_index.is_stale())
+        self.assertEqual(reader_index.count(), total)
+
+        res = writer.test_client().post('/quizzes', json={
+            'previous_questions': [], 'quiz_category': {'id': 2}})
+        self.assertEqual(json.loads(res.data)['question']['category'], 2)
+
+        res = writer.test_client().post('/questions', json={
+            'question': 'Which metal is liquid at room temperature?',
+            'answer': 'Mercury', 'category': 1, 'difficulty': 2})
+        question_id = json.loads(res.data)['created']
+
+        for _ in range(50):
+            if not reader_index.is_stale() and \
+                    reader_index.count() == total + 1:
+                break
+            time.sleep(0.1)
+        self.assertEqual(reader_index.count(), total + 1)
+        self.assertEqual(reader_index.category_of(question_id), 1)
+
+        writer.test_client().delete('/questions/{}'.format(question_id))
+
+    @wsgi_only
+    def test_429_rate_limit(self):
+        '''A client past the rate of a route gets a 429 with Retry-After'''
+        client = create_app({
+            'DATABASE_URL': self.database_path,
+            'RATE_LIMIT_CLIENT_KEY': 'remote_addr',
+            'RATE_LIMITS': {'search': (0.1, 2)},
+            'CLIENT_RATE_LIMITS': {'10.0.0.1': {'search': None}}
+        }).test_client()
+        search_json = {'searchTerm': 'movie'}
+
+        for _ in range(2):
+            res = client.post('/questions', json=search_json)
+            self.assertEqual(res.status_code, 200)
+
+        res = client.post('/questions', json=search_json)
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 429)
+        self.assertEqual(data['success'], False)
+        self.assertEqual(res.headers['Retry-After'], '10')
+
+        # other routes and clients without a limit are still served
+        self.assertEqual(client.get('/questions').status_code, 200)
+        res = client.post('/questions', json=search_json,
+                          environ_base={'REMOTE_ADDR': '10.0.0.1'})
+        self.assertEqual(res.status_code, 200)
+
+    @wsgi_only
+    def test_rate_limit_needs_client_key(self):
+        '''Clients are only rate limited once the app can tell them apart'''
+        search_json = {'searchTerm': 'movie'}
+        config = {
+            'DATABASE_URL': self.database_path,
+            'RATE_LIMITS': {'search': (0.1, 1)}
+        }
+
+        # no client key, or a proxy header missing from the request
+        for key in (None, 'X-Real-IP'):
+            client = create_app(
+                dict(config, RATE_LIMIT_CLIENT_KEY=key)).test_client()
+            for _ in range(3):
+                res = client.post('/questions', json=search_json)
+                self.assertEqual(res.status_code, 200)
+
+        client = create_app(
+            dict(config, RATE_LIMIT_CLIENT_KEY='X-Real-IP')).test_client()
+        headers = {'X-Real-IP': '10.0.0.3'}
+        res = client.post('/questions', json=search_json, headers=headers)
+        self.assertEqual(res.status_code, 200)
+        res = client.post('/questions', json=search_json, headers=headers)
+        self.assertEqual(res.status_code, 429)
+        res = client.post('/questions', json=search_json,
+                          headers={'X-Real-IP': '10.0.0.4'})
+        self.assertEqual(res.status_code, 200)
+
+    @wsgi_only
+    def test_503_concurrency_limit(self):
+        '''A worker running as many quizzes as allowed answers 503'''
+        app = create_app({
+            'DATABASE_URL': self.database_path,
+            'CONCURRENCY_LIMITS': {'get_quiz': 1}
+        })
+        quiz_json = {'previous_questions': [], 'quiz_category': {'id': 0}}
+
+        # a quiz request of another client is running
+        app.extensions['concurrency_gate'].enter('get_quiz', '10.0.0.2')
+        res = app.test_client().post('/quizzes', json=quiz_json)
+
+        self.assertEqual(res.status_code, 503)
+        self.assertEqual(res.headers['Retry-After'], '1')
+
+        app.extensions['concurrency_gate'].leave('get_quiz', '10.0.0.2')
+        res = app.test_client().post('/quizzes', json=quiz_json)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(app.extensions['concurrency_gate'].in_flight(), {})
+
+    @wsgi_only
+    def test_admission_control_off(self):
+        '''No limit applies with ADMISSION_CONTROL off'''
+        app = create_app({
+            'DATABASE_URL': self.database_path,
+            'ADMISSION_CONTROL': False,
+            'CONCURRENCY_LIMITS': {'get_quiz': 1}
+        })
+        quiz_json = {'previous_questions': [], 'quiz_category': {'id': 0}}
+
+        app.extensions['concurrency_gate'].enter('get_quiz', None)
+        res = app.test_client().post('/quizzes', json=quiz_json)
+
+        self.assertEqual(res.status_code, 200)
+        app.extensions['concurrency_gate'].leave('get_quiz', None)
+
+    @wsgi_only
+    def test_get_stats(self):
+        '''Get the number of questions per category and difficulty'''
+        res = self.client().get('/stats')
+        data = json.loads(res.data)
+        art = json.loads(self.client().get('/categories/2/questions').data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['success'], True)
+        self.assertEqual(data['total_questions'], json.loads(
+            self.client().get('/questions').data)['total_questions'])
+        self.assertEqual(data['categories']['2']['type'], 'Art')
+        self.assertEqual(data['categories']['2']['total_questions'],
+                         art['total_questions'])
+        self.assertEqual(
+            sum(data['categories']['2']['difficulties'].values()),
+            art['total_questions'])
+
+    @wsgi_only
+    def test_read_replica_routing(self):
+        '''Read from the replica, and from the primary after a write'''
+        app = create_app({
+            'DATABASE_URL': self.database_path,
+            'DATABASE_REPLICA_URLS': self.replica_path
+        })
+        client = app.test_client()
+
+        client.get('/questions')
+        replica = json.loads(client.get('/metrics/replicas').data)[
+            'replicas']['replica_0']
+
+        self.assertTrue(replica['healthy'])
+        self.assertGreater(replica['reads'], 0)
+
+        res = client.post('/questions', json={
+            'question': 'What is the capital of Burkina Faso?',
+            'answer': 'Ouagadougou',
+            'category': 3,
+            'difficulty': 4
+        })
+        self.assertIn('trivia_read_primary', res.headers['Set-Cookie'])
+
+        # the cookie sends the next reads of the client to the primary
+        client.get('/questions?page=2')
+        status = json.loads(client.get('/metrics/replicas').data)
+        client.delete('/questions/{}'.format(json.loads(res.data)['created']))
+
+        self.assertEqual(status['replicas']['replica_0']['reads'],
+                         replica['reads'])
+
+    @wsgi_only
+    def test_search_reads_from_replica(self):
+        '''A search is a read, it does not pin the client to the primary'''
+        client = create_app({
+            'DATABASE_URL': self.database_path,
+            'DATABASE_REPLICA_URLS': self.replica_path
+        }).test_client()
+
+        res = client.post('/questions', json={'searchTerm': 'movie'})
+        replica = json.loads(client.get('/metrics/replicas').data)[
+            'replicas']['replica_0']
+
+        self.assertEqual(res.status_code, 200)
+        self.assertNotIn('Set-Cookie', res.headers)
+        self.assertGreater(replica['reads'], 0)
+
+        session_id = json.loads(client.post('/quizzes/sessions').data)[
+            'session_id']
+        res = client.delete('/quizzes/sessions/{}'.format(session_id))
+        self.assertEqual(res.status_code, 200)
+        self.assertNotIn('Set-Cookie', res.headers)
+
+    @wsgi_only
+    def test_get_request_metrics(self):
+        '''Get the queries and timings per route'''
+        res = self.client().get('/questions?page=1')
+        self.assertIn('db;dur=', res.headers['Server-Timing'])
+
+        res = self.client().get('/metrics/requests')
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['success'], True)
+        self.assertEqual(data['routes']['GET /questions']['requests'], 1)
+        self.assertGreater(data['routes']['GET /questions']['queries'], 0)
+
+    @wsgi_only
+    def test_slow_query_log(self):
+        '''Log every query with a threshold of 0 ms'''
+        self.app.config['SLOW_QUERY_MS'] = 0
+
+        with self.assertLogs(self.app.logger, 'WARNING') as logs:
+            self.client().get('/questions/stream?category=1')
+
+        self.assertIn('slow query', logs.output[0])
+        self.assertIn('parameters', logs.output[0])
+
     def test_405_get_quiz(self):
         '''Get quizzes with GET method'''
         res = self.client().get('/quizzes')
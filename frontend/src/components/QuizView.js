@@ -21,6 +21,7 @@ class QuizView extends Component {
       categories: {},
       numCorrect: 0,
       currentQuestion: {},
+      questions: [],
       guess: '',
       forceEnd: false
   }
@@ -42,38 +43,33 @@ class QuizView extends Component {
   }
 
   selectCategory = ({type, id=0}) => {
-    this.setState({quizCategory: {type, id}}, this.getNextQuestion)
+    this.setState({quizCategory: {type, id}}, this.getQuestions)
   }
 
   handleChange = (event) => {
     this.setState({[event.target.name]: event.target.value})
   }
 
-  getNextQuestion = () => {
-    const previousQuestions = [...this.state.previousQuestions]
-    if(this.state.currentQuestion.id) { previousQuestions.push(this.state.currentQuestion.id) }
-
+  // loads the questions of a whole play in one request
+  getQuestions = () => {
     $.ajax({
       url: '/quizzes', //DONE: update request URL
       type: "POST",
       dataType: 'json',
       contentType: 'application/json',
       data: JSON.stringify({
-        previous_questions: previousQuestions,
-        quiz_category: this.state.quizCategory
+        previous_questions: this.state.previousQuestions,
+        quiz_category: this.state.quizCategory,
+        count: questionsPerPlay,
+        // served from a precomputed deck when the server has decks
+        deck: null
       }),
       xhrFields: {
         withCredentials: true
       },
       crossDomain: true,
       success: (result) => {
-        this.setState({
-          showAnswer: false,
-          previousQuestions: previousQuestions,
-          currentQuestion: result.question,
-          guess: '',
-          forceEnd: result.question ? false : true
-        })
+        this.setState({ questions: result.questions }, this.getNextQuestion)
         return;
       },
       error: (error) => {
@@ -83,6 +79,21 @@ class QuizView extends Component {
     })
   }
 
+  getNextQuestion = () => {
+    const previousQuestions = [...this.state.previousQuestions]
+    if(this.state.currentQuestion.id) { previousQuestions.push(this.state.currentQuestion.id) }
+
+    const [nextQuestion, ...questions] = this.state.questions
+    this.setState({
+      showAnswer: false,
+      previousQuestions: previousQuestions,
+      currentQuestion: nextQuestion || {},
+      questions: questions,
+      guess: '',
+      forceEnd: nextQuestion ? false : true
+    })
+  }
+
   submitGuess = (event) => {
     event.preventDefault();
     let evaluate =  this.evaluateAnswer()
@@ -99,6 +110,7 @@ class QuizView extends Component {
       showAnswer: false,
       numCorrect: 0,
       currentQuestion: {},
+      questions: [],
       guess: '',
       forceEnd: false
     })
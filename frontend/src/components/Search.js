@@ -3,11 +3,13 @@ import {
   Input,
   Button,
 } from 'semantic-ui-react'
+import $ from 'jquery';
 
 
 class Search extends Component {
   state = {
     query: '',
+    suggestions: [],
   }
 
   getInfo = (event) => {
@@ -15,10 +17,34 @@ class Search extends Component {
     this.props.submitSearch(this.state.query)
   }
 
+  getSuggestions = (query) => {
+    if (!query.trim()) {
+      this.setState({ suggestions: [] })
+      return;
+    }
+
+    $.ajax({
+      url: `/questions/autocomplete?q=${encodeURIComponent(query)}`,
+      type: "GET",
+      success: (result) => {
+        // an older answer must not replace the suggestions of a newer query
+        if (query === this.state.query) {
+          this.setState({ suggestions: result.suggestions })
+        }
+        return;
+      },
+      error: (error) => {
+        this.setState({ suggestions: [] })
+        return;
+      }
+    })
+  }
+
   handleInputChange = (event, data) => {
     this.setState({
       query: data.value
     })
+    this.getSuggestions(data.value)
   }
 
   render() {
@@ -26,8 +52,14 @@ class Search extends Component {
       <form onSubmit={this.getInfo}>
         <Input
           placeholder='Search questions...'
+          list='search-suggestions'
           onChange={this.handleInputChange}
         />
+        <datalist id='search-suggestions'>
+          {this.state.suggestions.map((suggestion) => (
+            <option key={suggestion} value={suggestion} />
+          ))}
+        </datalist>
         <Button className="search-btn" type="submit">Search</Button>
       </form>
     )